@@ -3,21 +3,56 @@
 # Versión corregida y mejorada del script original proporcionado por el usuario.
 # Basado en: InformesAlMayor.py. (referencia incluida en la conversación). :contentReference[oaicite:1]{index=1}
 
-import tkinter as tk
-from tkinter import filedialog, messagebox, ttk
 from openpyxl import load_workbook
+from openpyxl.utils.cell import range_boundaries
 from docx import Document
 from docx.shared import Cm, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.enum.table import WD_ALIGN_VERTICAL
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml.ns import nsmap
+from docx.table import _Cell
+from docx.text.paragraph import Paragraph
+from docx.text.run import Run
+from lxml import etree
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él se insertan las fotos originales
+    Image = None
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él los agregados de rango usan statistics
+    np = None
 import os
+import io
+import hashlib
 import json
+import statistics
 import threading
+import logging
+from logging.handlers import RotatingFileHandler
+import sqlite3
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 import re
 import glob
 import platform
 import math
+import sys
+import argparse
+import csv
+import contextlib
+import cProfile
+import pstats
+import time
+import tracemalloc
+import zipfile
+
+# tkinter se importa solo al abrir la GUI (ver main_gui): el modo por línea
+# de comandos y los procesos de trabajo no lo necesitan.
+tk = filedialog = messagebox = ttk = None
 
 # ---------------------------
 # Utilidades generales
@@ -66,202 +101,2587 @@ def aplicar_formato_documento(doc, font_config):
         # No romper el flujo por errores de formato.
         pass
 
-def reemplazar_texto_global(doc, viejo, nuevo):
-    """Reemplazar texto en párrafos y tablas (busca en runs para mantener formato cuando es posible)."""
-    if viejo == "":
-        return
-    # Reemplazos en párrafos
-    for p in doc.paragraphs:
-        if viejo in p.text:
+class ReemplazadorTexto:
+    """
+    Motor de reemplazo de texto: compila una lista ordenada de pares (viejo, nuevo)
+    y la aplica al documento en un único recorrido de párrafos y celdas.
+    Un patrón combinado descarta rápido los textos sin ninguna coincidencia; en los
+    demás los pares se aplican en orden, igual que llamadas sucesivas a
+    reemplazar_texto_global (un par puede actuar sobre el resultado del anterior).
+    - conservar_formato=False: reconstruye el párrafo/celda con un run nuevo (modo clásico).
+    - conservar_formato=True: edita solo los runs que abarca cada coincidencia (aunque
+      esté partida entre varios runs); el resto de runs y su formato no se tocan.
+    """
+
+    def __init__(self, pares, conservar_formato=False):
+        self.conservar_formato = conservar_formato
+        self.pares = [(str(viejo), str(nuevo)) for viejo, nuevo in pares if str(viejo) != ""]
+        if self.pares:
+            viejos = sorted({v for v, _ in self.pares}, key=len, reverse=True)
+            self._patron = re.compile("|".join(re.escape(v) for v in viejos))
+        else:
+            self._patron = None
+
+    def transformar(self, texto):
+        """Devuelve el texto reemplazado, o None si ningún par aparece en él."""
+        if self._patron is None or not self._patron.search(texto):
+            return None
+        for viejo, nuevo in self.pares:
+            if viejo in texto:
+                texto = texto.replace(viejo, nuevo)
+        return texto
+
+    def _reemplazar_en_runs(self, parrafo):
+        """Reemplazo in situ: solo se reescriben los runs que contienen parte de una coincidencia."""
+        runs = parrafo.runs
+        if not runs:
+            return
+        textos = [r.text for r in runs]
+        completo = "".join(textos)
+        if not self._patron.search(completo):
+            return
+        cambiados = set()
+        for viejo, nuevo in self.pares:
+            inicio = completo.find(viejo)
+            while inicio != -1:
+                fin = inicio + len(viejo)
+                pos = 0
+                primero = True
+                for i, t in enumerate(textos):
+                    a, b = pos, pos + len(t)
+                    pos = b
+                    if not t or b <= inicio or a >= fin:
+                        continue
+                    ini_local = max(inicio - a, 0)
+                    fin_local = min(fin - a, len(t))
+                    # el texto nuevo queda en el run donde empieza la coincidencia
+                    textos[i] = t[:ini_local] + (nuevo if primero else "") + t[fin_local:]
+                    primero = False
+                    cambiados.add(i)
+                completo = "".join(textos)
+                inicio = completo.find(viejo, inicio + len(nuevo))
+        for i in cambiados:
+            runs[i].text = textos[i]
+
+    def _reconstruir_parrafo(self, p):
+        full = self.transformar(p.text)
+        if full is not None:
             # reconstruir runs: operación simple y segura
-            full = p.text.replace(viejo, nuevo)
-            # limpiar runs
             for r in list(p.runs):
                 r.text = ""
             p.add_run(full)
 
-    # Reemplazos en tablas
+    def _reconstruir_celda(self, celda):
+        texto = self.transformar(celda.text)
+        if texto is None:
+            return
+        # limpiar y escribir
+        for rp in list(celda.paragraphs):
+            rp.clear()  # available in python-docx 0.8.11+; if fails, fallback
+        # fallback seguro:
+        try:
+            celda.text = texto
+        except Exception:
+            # última opción: sustituir runs
+            for r in celda.paragraphs[0].runs:
+                r.text = ""
+            celda.paragraphs[0].add_run(texto)
+
+    def aplicar(self, doc, indice=None):
+        """
+        Aplica los reemplazos. Con un IndicePlantilla construido para estos textos
+        solo se visitan los párrafos/celdas donde la plantilla tiene coincidencias.
+        """
+        if self._patron is None:
+            return
+        if indice is not None:
+            parrafos, celdas = indice.resolver_ocurrencias(doc)
+        else:
+            parrafos, celdas = doc.paragraphs, celdas_unicas(doc)
+        # Reemplazos en párrafos
+        for p in parrafos:
+            if self.conservar_formato:
+                self._reemplazar_en_runs(p)
+            else:
+                self._reconstruir_parrafo(p)
+        # Reemplazos en tablas
+        for celda in celdas:
+            if self.conservar_formato:
+                for p in celda.paragraphs:
+                    self._reemplazar_en_runs(p)
+            else:
+                self._reconstruir_celda(celda)
+
+def reemplazar_texto_global(doc, viejo, nuevo):
+    """Reemplazar texto en párrafos y tablas (busca en runs para mantener formato cuando es posible)."""
+    ReemplazadorTexto([(viejo, nuevo)]).aplicar(doc)
+
+def reemplazar_textos_global(doc, pares, conservar_formato=False, indice=None):
+    """Aplicar varios reemplazos (en orden) con un solo recorrido del documento."""
+    ReemplazadorTexto(pares, conservar_formato).aplicar(doc, indice)
+
+def celdas_unicas(doc):
+    """Celdas de las tablas del documento; las combinadas (repetidas en row.cells) una sola vez."""
+    vistas = set()
     for tabla in doc.tables:
         for fila in tabla.rows:
             for celda in fila.cells:
-                if viejo in celda.text:
-                    texto = celda.text.replace(viejo, nuevo)
-                    # limpiar y escribir
-                    for rp in list(celda.paragraphs):
-                        rp.clear()  # available in python-docx 0.8.11+; if fails, fallback
-                    # fallback seguro:
-                    try:
-                        celda.text = texto
-                    except Exception:
-                        # última opción: sustituir runs
-                        for r in celda.paragraphs[0].runs:
-                            r.text = ""
-                        celda.paragraphs[0].add_run(texto)
+                if celda._tc in vistas:
+                    continue
+                vistas.add(celda._tc)
+                yield celda
+
+class PlantillaWord:
+    """
+    Documento Word base leído una sola vez por ejecución.
+    Cada informe se crea desde el buffer en memoria, sin volver a tocar el disco
+    (importante cuando la plantilla está en una unidad de red).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.contenido = f.read()
+
+    def nuevo_documento(self):
+        """Devuelve un Document nuevo e independiente, idéntico a la plantilla."""
+        return Document(io.BytesIO(self.contenido))
+
+# runs que contienen una imagen (DrawingML o VML), también envuelta en
+# mc:AlternateContent; los runs dentro de cuadros de texto se omiten porque la
+# imagen ya cuenta en el run que contiene el cuadro
+_NS_IMAGEN = dict(nsmap, mc="http://schemas.openxmlformats.org/markup-compatibility/2006")
+
+def _xpath_runs_imagen(ruta):
+    return etree.XPath(
+        ruta + "w:r[(w:drawing or w:pict or mc:AlternateContent[.//w:drawing or .//w:pict])"
+        " and not(ancestor::w:txbxContent)]",
+        namespaces=_NS_IMAGEN)
+
+_RUNS_IMAGEN_PARRAFOS = _xpath_runs_imagen("./w:p/")
+_RUNS_IMAGEN_TABLAS = _xpath_runs_imagen("./w:tr/w:tc/w:p/")
+_RUNS_IMAGEN_TODOS = _xpath_runs_imagen(".//")
+_ES_RUN_IMAGEN = _xpath_runs_imagen("self::")
+
+def partes_encabezado_pie(doc):
+    """Partes de encabezados y pies de página del documento (sin crear ninguna)."""
+    partes = []
+    for rel in doc.part.rels.values():
+        if not rel.is_external and rel.reltype in (RT.HEADER, RT.FOOTER):
+            partes.append(rel.target_part)
+    return partes
 
 def listar_imagenes_doc(doc):
     """
     Listar imágenes en el documento (párrafos y tablas).
     Devuelve lista de dicts: {'run': run_obj, 'paragraph': p_obj, 'idx_global': i}
+    Consultas XPath directas sobre el XML, en este orden: párrafos del cuerpo,
+    celdas de las tablas del cuerpo, resto del cuerpo (tablas anidadas, controles
+    de contenido...) y por último encabezados y pies de página.
     """
     imagenes = []
-    idx = 0
-    # revisar párrafos
-    for p in doc.paragraphs:
-        for run in p.runs:
-            try:
-                xml = run._element.xml
-                if '<w:drawing' in xml or '<w:pict' in xml:
-                    imagenes.append({"run": run, "paragraph": p, "idx_global": idx})
-                    idx += 1
-            except Exception:
+    vistos = set()
+
+    def agregar(runs, parent):
+        for r in runs:
+            if r in vistos:
+                continue
+            vistos.add(r)
+            p_el = r.xpath("./ancestor::w:p[1]")
+            if not p_el:
                 continue
+            p = Paragraph(p_el[0], parent)
+            imagenes.append({"run": Run(r, p), "paragraph": p, "idx_global": len(imagenes)})
 
+    body = doc.element.body
+    # revisar párrafos
+    agregar(_RUNS_IMAGEN_PARRAFOS(body), doc._body)
     # revisar tablas
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for p in cell.paragraphs:
-                    for run in p.runs:
-                        try:
-                            xml = run._element.xml
-                            if '<w:drawing' in xml or '<w:pict' in xml:
-                                imagenes.append({"run": run, "paragraph": p, "idx_global": idx})
-                                idx += 1
-                        except Exception:
-                            continue
+    for tbl in body.xpath("./w:tbl"):
+        agregar(_RUNS_IMAGEN_TABLAS(tbl), doc._body)
+    # tablas anidadas y demás contenedores
+    agregar(_RUNS_IMAGEN_TODOS(body), doc._body)
+    # encabezados y pies de página
+    for parte in partes_encabezado_pie(doc):
+        agregar(_RUNS_IMAGEN_TODOS(parte.element), parte)
 
     return imagenes
 
+class IndicePlantilla:
+    """
+    Índice de la plantilla calculado una vez por ejecución y reutilizado en todas
+    las calicatas (cada informe es una copia con la misma estructura):
+      - por tabla: encabezado -> columna, cabecera de fila -> fila;
+      - posiciones de las imágenes (parte y ruta del run dentro del XML);
+      - párrafos/celdas donde aparecen los textos a reemplazar.
+    Las tablas cuyo encabezado contiene un texto a reemplazar se marcan como
+    volátiles y se vuelven a leer en cada documento.
+    """
+
+    def __init__(self, doc, textos_buscados=()):
+        arbol = doc.element.getroottree()
+        buscados = [str(t) for t in textos_buscados if str(t) != ""]
+
+        def contiene(texto):
+            return any(b in texto for b in buscados)
+
+        self.tablas = []  # {"encabezados": [...], "filas": [...], "volatil": bool}
+        self.columnas = {}  # encabezado -> [(idx_tabla, idx_columna)] (primera coincidencia por tabla)
+        self.tablas_volatiles = []
+        for t_idx, tabla in enumerate(doc.tables):
+            filas = tabla.rows
+            if not filas:
+                self.tablas.append({"encabezados": [], "filas": [], "volatil": False})
+                continue
+            headers = [c.text.strip() for c in filas[0].cells]
+            cabeceras_fila = [(f.cells[0].text.strip() if f.cells else "") for f in filas[1:]]
+            volatil = contiene("".join(headers))
+            self.tablas.append({"encabezados": headers, "filas": cabeceras_fila, "volatil": volatil})
+            if volatil:
+                self.tablas_volatiles.append(t_idx)
+                continue
+            for idx, h in enumerate(headers):
+                ubicaciones = self.columnas.setdefault(h, [])
+                if not ubicaciones or ubicaciones[-1][0] != t_idx:
+                    ubicaciones.append((t_idx, idx))
+
+        self.imagenes = []  # (partname o "" para el cuerpo, ruta del run, ruta del párrafo)
+        for img in listar_imagenes_doc(doc):
+            r_el = img["run"]._element
+            parte = img["run"].part
+            if parte is doc.part:
+                nombre_parte, arbol_parte = "", arbol
+            else:
+                nombre_parte, arbol_parte = str(parte.partname), parte.element.getroottree()
+            self.imagenes.append((nombre_parte, arbol_parte.getelementpath(r_el), arbol_parte.getelementpath(img["paragraph"]._element)))
+
+        self.parrafos_con_texto = []
+        self.celdas_con_texto = []
+        if buscados:
+            self.parrafos_con_texto = [arbol.getelementpath(p._element) for p in doc.paragraphs if contiene(p.text)]
+            self.celdas_con_texto = [arbol.getelementpath(c._tc) for c in celdas_unicas(doc) if contiene(c.text)]
+
+    def resolver_ocurrencias(self, doc):
+        """Párrafos y celdas del documento 'doc' que pueden contener textos a reemplazar."""
+        raiz = doc.element
+        parrafos = [Paragraph(el, doc._body) for el in (raiz.find(r) for r in self.parrafos_con_texto) if el is not None]
+        celdas = [_Cell(el, doc._body) for el in (raiz.find(r) for r in self.celdas_con_texto) if el is not None]
+        return parrafos, celdas
+
+    def resolver_imagenes(self, doc):
+        """
+        Igual que listar_imagenes_doc(doc) pero por búsqueda directa. Si algún run ya
+        no contiene la imagen (p. ej. el párrafo se reconstruyó), recorre el documento.
+        """
+        partes = {"": (doc.element, doc._body)}
+        for parte in partes_encabezado_pie(doc):
+            partes[str(parte.partname)] = (parte.element, parte)
+        imagenes = []
+        for i, (nombre_parte, ruta_run, ruta_parrafo) in enumerate(self.imagenes):
+            raiz, parent = partes.get(nombre_parte, (None, None))
+            r_el = raiz.find(ruta_run) if raiz is not None else None
+            p_el = raiz.find(ruta_parrafo) if raiz is not None else None
+            if r_el is None or p_el is None or not _ES_RUN_IMAGEN(r_el):
+                return listar_imagenes_doc(doc)
+            p = Paragraph(p_el, parent)
+            imagenes.append({"run": Run(r_el, p), "paragraph": p, "idx_global": i})
+        return imagenes
+
 def reemplazar_imagen(run, ruta_imagen, fixed_height_cm=None):
     """
     Reemplaza la imagen contenida en 'run' por la imagen en ruta.
     run: objeto Run (python-docx)
+    ruta_imagen: ruta del archivo o flujo binario con la imagen ya leída
     """
-    if not os.path.exists(ruta_imagen):
+    if isinstance(ruta_imagen, str) and not os.path.exists(ruta_imagen):
         raise FileNotFoundError(f"Imagen no encontrada: {ruta_imagen}")
 
-    # Borrar contenido del run
-    try:
-        # clear() no está siempre documentado; en muchas versiones funciona
-        run.clear()
-    except Exception:
-        # alternativa: poner texto vacío en cada run
-        run.text = ""
+    # Borrar contenido del run
+    try:
+        # clear() no está siempre documentado; en muchas versiones funciona
+        run.clear()
+    except Exception:
+        # alternativa: poner texto vacío en cada run
+        run.text = ""
+
+    # Insertar nueva imagen
+    try:
+        if fixed_height_cm:
+            run.add_picture(ruta_imagen, height=Cm(float(fixed_height_cm)))
+        else:
+            run.add_picture(ruta_imagen)
+    except Exception as e:
+        # fallback: intentar sin height
+        try:
+            run.add_picture(ruta_imagen)
+        except Exception as e2:
+            raise Exception(f"No se pudo insertar la imagen {ruta_imagen}: {str(e2)}")
+
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".tiff")
+
+def formatear_bytes(n):
+    if n >= 1048576:
+        return f"{n / 1048576:.1f} MB"
+    return f"{n / 1024:.0f} KB"
+
+class CacheImagenes:
+    """
+    Copias de las fotos reducidas a la altura con que se colocan en el informe
+    (alto_cm a 'dpi' puntos por pulgada), guardadas en disco y reutilizadas entre
+    ejecuciones. La clave es ruta + fecha de modificación + tamaño del original +
+    altura en píxeles + calidad, así una foto editada se vuelve a procesar.
+    Nunca se amplía: si el original ya es más pequeño se inserta tal cual.
+    Se conservan los metadatos EXIF (orientación, fecha...).
+    Sin Pillow, o con activo=False, preparar() devuelve siempre el original.
+    """
+
+    def __init__(self, carpeta, dpi=200, calidad=85, activo=True):
+        self.carpeta = carpeta
+        self.dpi = max(int(dpi), 1)
+        self.calidad = min(max(int(calidad), 1), 95)
+        self.activo = bool(activo and Image is not None and carpeta)
+        self.estadisticas = {"aciertos": 0, "generadas": 0, "originales": 0, "bytes_origen": 0, "bytes_insertados": 0}
+
+    @classmethod
+    def desde_config(cls, config):
+        ic = config.get("imagen_config", {})
+        carpeta = ic.get("carpeta_cache") or (os.path.join(config["output_folder"], ".cache_imagenes") if config.get("output_folder") else "")
+        return cls(carpeta, ic.get("dpi", 200), ic.get("calidad_jpeg", 85), ic.get("optimizar", True))
+
+    def _clave(self, ruta, st, alto_px):
+        datos = f"{os.path.abspath(ruta)}|{st.st_mtime_ns}|{st.st_size}|{alto_px}|{self.calidad}"
+        return hashlib.sha1(datos.encode("utf-8")).hexdigest()
+
+    def preparar(self, ruta, alto_cm):
+        """Devuelve la ruta a insertar para 'ruta' colocada con 'alto_cm' de altura."""
+        st = os.stat(ruta)
+        self.estadisticas["bytes_origen"] += st.st_size
+        destino = None
+        if self.activo and alto_cm and os.path.splitext(ruta)[1].lower() in EXTENSIONES_IMAGEN:
+            try:
+                destino = self._reducida(ruta, st, max(int(round(float(alto_cm) / 2.54 * self.dpi)), 1))
+            except Exception:
+                destino = None  # imagen ilegible para Pillow: que la inserte python-docx
+        if destino is None:
+            self.estadisticas["originales"] += 1
+            destino = ruta
+        self.estadisticas["bytes_insertados"] += os.path.getsize(destino)
+        return destino
+
+    def _reducida(self, ruta, st, alto_px):
+        """Ruta de la copia reducida (None si no hace falta reducir)."""
+        ext_jpeg = os.path.splitext(ruta)[1].lower() in (".jpg", ".jpeg")
+        clave = self._clave(ruta, st, alto_px)
+        destino = os.path.join(self.carpeta, clave + (".jpg" if ext_jpeg else ".png"))
+        if os.path.exists(destino):
+            self.estadisticas["aciertos"] += 1
+            return destino
+        with Image.open(ruta) as img:
+            ancho, alto = img.size
+            if alto <= alto_px:
+                return None
+            nuevo = (max(int(round(ancho * alto_px / alto)), 1), alto_px)
+            exif = img.info.get("exif")
+            if ext_jpeg:
+                img.draft(img.mode, nuevo)  # decodifica ya reducido (escala DCT)
+            reducida = img.resize(nuevo, Image.LANCZOS)
+            os.makedirs(self.carpeta, exist_ok=True)
+            # escribir a un temporal y renombrar: otros procesos (o hilos) pueden leer la caché a la vez
+            tmp = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                if ext_jpeg:
+                    if reducida.mode not in ("RGB", "L", "CMYK"):
+                        reducida = reducida.convert("RGB")
+                    opciones = {"quality": self.calidad, "optimize": True}
+                else:
+                    opciones = {"optimize": True}
+                if exif:
+                    opciones["exif"] = exif
+                reducida.save(tmp, "JPEG" if ext_jpeg else "PNG", dpi=(self.dpi, self.dpi), **opciones)
+                os.replace(tmp, destino)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+        self.estadisticas["generadas"] += 1
+        return destino
+
+    @staticmethod
+    def formatear_resumen(est):
+        usadas = est["aciertos"] + est["generadas"]
+        tasa = f"{est['aciertos'] / usadas * 100:.0f}%" if usadas else "-"
+        return (f"{est['aciertos']} de caché, {est['generadas']} reducidas, {est['originales']} originales"
+                f" (aciertos {tasa}) | {formatear_bytes(est['bytes_origen'])} -> {formatear_bytes(est['bytes_insertados'])}")
+
+    def resumen(self):
+        return self.formatear_resumen(self.estadisticas)
+
+class SesionExcel:
+    """
+    Mantiene abiertos los libros Excel de una ejecución para que todos los
+    mapeos de una calicata se sirvan del mismo libro (un solo parseo por .xlsx).
+    Lleva la cuenta de aperturas (fallos de caché) y reutilizaciones (aciertos).
+    Usar como context manager para garantizar el cierre de los libros.
+    - solo_lectura: usa el modo streaming de openpyxl (read_only=True); las hojas
+      se leen bajo demanda y nunca se materializan las que no se usan.
+    - medir: registra tiempo y pico de memoria entre abrir() y liberar() de cada libro.
+    """
+
+    def __init__(self, solo_lectura=False, medir=False):
+        self.solo_lectura = solo_lectura
+        self.medir = medir
+        self._libros = {}
+        self._inicios = {}
+        self.aperturas = 0
+        self.reutilizaciones = 0
+        self.mediciones = []  # (nombre, segundos, pico_bytes)
+        self._tracemalloc_propio = False
+        if medir and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_propio = True
+
+    def abrir(self, excel_path):
+        """Devuelve el libro ya abierto o lo carga una única vez."""
+        clave = os.path.abspath(excel_path)
+        wb = self._libros.get(clave)
+        if wb is None:
+            if self.medir:
+                tracemalloc.reset_peak()
+                self._inicios[clave] = (time.perf_counter(), tracemalloc.get_traced_memory()[0])
+            wb = load_workbook(excel_path, read_only=self.solo_lectura, data_only=True)
+            self._libros[clave] = wb
+            self.aperturas += 1
+        else:
+            self.reutilizaciones += 1
+        return wb
+
+    def liberar(self, excel_path):
+        """
+        Cerrar y olvidar un libro (al terminar con su calicata).
+        Si la sesión mide recursos devuelve (nombre, segundos, pico_bytes).
+        """
+        clave = os.path.abspath(excel_path)
+        wb = self._libros.pop(clave, None)
+        if wb is not None:
+            try:
+                wb.close()
+            except Exception:
+                pass
+        inicio = self._inicios.pop(clave, None)
+        if inicio is None:
+            return None
+        t0, mem0 = inicio
+        medicion = (os.path.basename(clave), time.perf_counter() - t0, max(tracemalloc.get_traced_memory()[1] - mem0, 0))
+        self.mediciones.append(medicion)
+        return medicion
+
+    def cerrar(self):
+        for clave in list(self._libros.keys()):
+            self.liberar(clave)
+        if self._tracemalloc_propio:
+            tracemalloc.stop()
+            self._tracemalloc_propio = False
+
+    def resumen(self):
+        texto = f"{self.aperturas} aperturas, {self.reutilizaciones} reutilizaciones"
+        if self.mediciones:
+            tiempos = [m[1] for m in self.mediciones]
+            picos = [m[2] for m in self.mediciones]
+            modo = "streaming" if self.solo_lectura else "completo"
+            texto += (f" | modo {modo}: {sum(tiempos) / len(tiempos):.3f} s/libro (máx {max(tiempos):.3f} s),"
+                      f" pico medio {sum(picos) / len(picos) / 1048576:.1f} MB (máx {max(picos) / 1048576:.1f} MB)")
+        return texto
+
+    @staticmethod
+    def formatear_medicion(medicion):
+        nombre, segundos, pico = medicion
+        return f"⏱️ {nombre}: {segundos:.3f} s, pico {pico / 1048576:.1f} MB"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
+
+def _redondear(valor, decimales_config):
+    """Aplica los decimales fijos configurados a valores numéricos."""
+    if isinstance(valor, (int, float)) and decimales_config.get("usar_decimales_fijos", False):
+        dec = int(decimales_config.get("cantidad_decimales", 1))
+        return round(valor, dec)
+    return valor
+
+def _compilar_celdas(celda):
+    """
+    Convierte "A1" | "A1:A10" | "C5,E7,F9" en una lista de rectángulos
+    (min_fila, min_col, max_fila, max_col), en el orden escrito.
+    """
+    partes = []
+    for p in str(celda).split(","):
+        p = p.strip().upper()
+        if not p:
+            continue
+        min_col, min_row, max_col, max_row = range_boundaries(p)
+        if None in (min_col, min_row, max_col, max_row):
+            raise ValueError(f"Referencia de celda inválida: {p}")
+        partes.append((min_row, min_col, max_row, max_col))
+    if not partes:
+        raise ValueError(f"Referencia de celda vacía: {celda}")
+    return partes
+
+class _RangoNumerico:
+    """
+    Números de un rango leídos una vez y los agregados que se piden sobre ellos.
+    promedio/min/max/suma se calculan en Python (ya son bucles en C y conservan
+    los enteros); std y mediana usan un arreglo NumPy, creado una sola vez, si
+    NumPy está instalado.
+    """
+
+    def __init__(self, numeros):
+        self.numeros = numeros
+        self._arreglo = None
+
+    def arreglo(self):
+        if self._arreglo is None:
+            self._arreglo = np.asarray(self.numeros, dtype=float)
+        return self._arreglo
+
+    def agregado(self, tipo):
+        numeros = self.numeros
+        if tipo == "conteo":
+            return len(numeros)
+        if tipo == "suma":
+            return sum(numeros)
+        if tipo == "promedio":
+            # rango sin números: 0, como siempre ha hecho el promedio
+            return sum(numeros) / len(numeros) if numeros else 0
+        if tipo not in PlanExtraccion.AGREGADOS:
+            raise ValueError(f"Tipo inválido: {tipo}")
+        # min/max/mediana/std de un rango vacío no existen: inventar un 0 sería un dato falso
+        if not numeros:
+            raise ValueError(f"El rango no tiene valores numéricos para calcular '{tipo}'")
+        if tipo == "min":
+            return min(numeros)
+        if tipo == "max":
+            return max(numeros)
+        if tipo == "std":
+            if len(numeros) < 2:
+                raise ValueError("'std' necesita al menos 2 valores numéricos en el rango")
+            if np is not None:
+                return float(self.arreglo().std(ddof=1))
+            # statistics.stdev usa aritmética exacta y es muy lento en rangos grandes
+            media = math.fsum(numeros) / len(numeros)
+            return math.sqrt(math.fsum((v - media) ** 2 for v in numeros) / (len(numeros) - 1))
+        if tipo == "mediana":
+            if np is not None:
+                return float(np.median(self.arreglo()))
+            return statistics.median(numeros)
+
+class ErrorLecturaHoja(ValueError):
+    """
+    Fallo leyendo una hoja existente (libro bloqueado, error de E/S, lectura
+    parcial en red...). Puede ser pasajero: no se guarda en la caché de valores.
+    """
+
+class PlanExtraccion:
+    """
+    Plan de extracción compilado una vez por ejecución a partir de config["mappings"].
+    Agrupa los mapeos por hoja, calcula la caja mínima (filas/columnas) que los
+    cubre y, por cada libro, lee esa caja de una sola pasada; luego resuelve
+    todos los "valor" y agregados desde el bloque en memoria. Los números de
+    cada rango se recogen una sola vez aunque varios mapeos pidan agregados
+    distintos del mismo rango.
+    """
+
+    # agregados sobre los números del rango; "std" es la desviación muestral (DESVEST)
+    AGREGADOS = ("promedio", "min", "max", "std", "mediana", "suma", "conteo")
+    TIPOS = ("valor",) + AGREGADOS
+
+    def __init__(self, mappings):
+        self.encabezados = []
+        self._entradas = []  # (encabezado, hoja, partes, tipo) en orden de mapeo
+        self._invalidos = {}  # encabezado -> excepción de compilación
+        self._cajas = {}  # hoja -> [min_fila, min_col, max_fila, max_col]
+        for m in mappings:
+            encabezado = m.get("encabezado")
+            if encabezado not in self.encabezados:
+                self.encabezados.append(encabezado)
+            try:
+                tipo = m.get("tipo", "valor")
+                if tipo not in self.TIPOS:
+                    raise ValueError(f"Tipo inválido: {tipo}")
+                partes = _compilar_celdas(m.get("celda", ""))
+            except Exception as e:
+                self._invalidos[encabezado] = e
+                continue
+            self._invalidos.pop(encabezado, None)
+            hoja = m.get("hoja")
+            self._entradas.append((encabezado, hoja, partes, tipo))
+            caja = self._cajas.setdefault(hoja, [partes[0][0], partes[0][1], partes[0][2], partes[0][3]])
+            for r0, c0, r1, c1 in partes:
+                caja[0] = min(caja[0], r0)
+                caja[1] = min(caja[1], c0)
+                caja[2] = max(caja[2], r1)
+                caja[3] = max(caja[3], c1)
+
+    def hojas(self):
+        return list(self._cajas.keys())
+
+    def claves(self):
+        """(encabezado, clave) de cada mapeo válido; la clave identifica hoja, celdas y tipo."""
+        return [(encabezado, f"{hoja}|{json.dumps(partes)}|{tipo}") for encabezado, hoja, partes, tipo in self._entradas]
+
+    def errores_compilacion(self):
+        return dict(self._invalidos)
+
+    def _leer_bloque(self, ws, caja):
+        # en modo streaming (read_only) iter_rows deja de parsear la hoja
+        # en cuanto pasa la última fila requerida
+        min_row, min_col, max_row, max_col = caja
+        filas = ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)
+        return [tuple(f) for f in filas]
+
+    @staticmethod
+    def _valores_parte(bloque, caja, parte):
+        """Recorre (fila a fila) los valores de un rectángulo dentro del bloque leído."""
+        r0, c0 = caja[0], caja[1]
+        for r in range(parte[0], parte[2] + 1):
+            fila = bloque[r - r0] if r - r0 < len(bloque) else ()
+            for c in range(parte[1], parte[3] + 1):
+                i = c - c0
+                yield fila[i] if i < len(fila) else None
+
+    @staticmethod
+    def _numeros(bloque, caja, partes):
+        """Números del rango (en el orden escrito), recortando cada fila del bloque de una vez."""
+        r0, c0 = caja[0], caja[1]
+        numeros = []
+        for parte in partes:
+            for fila in bloque[parte[0] - r0:parte[2] - r0 + 1]:
+                numeros.extend(v for v in fila[parte[1] - c0:parte[3] - c0 + 1] if isinstance(v, (int, float)))
+        return _RangoNumerico(numeros)
+
+    def _evaluar(self, bloque, caja, partes, tipo, decimales_config, rango=None):
+        if tipo == "valor":
+            # primera celda no vacía, en el orden escrito
+            for parte in partes:
+                for v in self._valores_parte(bloque, caja, parte):
+                    if v is not None:
+                        return _redondear(v, decimales_config)
+            return ""
+        if rango is None:
+            rango = self._numeros(bloque, caja, partes)
+        return _redondear(rango.agregado(tipo), decimales_config)
+
+    def extraer(self, wb, decimales_config, nombre_libro=""):
+        """
+        Resuelve todos los mapeos sobre un libro abierto.
+        Devuelve (valores, errores): dicts encabezado -> valor / excepción.
+        """
+        bloques = {}
+        for hoja, caja in self._cajas.items():
+            if hoja not in wb.sheetnames:
+                bloques[hoja] = ValueError(f"No se encontró la hoja '{hoja}' en {nombre_libro}")
+                continue
+            try:
+                bloques[hoja] = self._leer_bloque(wb[hoja], caja)
+            except Exception as e:
+                bloques[hoja] = ErrorLecturaHoja(f"Error leyendo hoja '{hoja}': {str(e)}")
+
+        valores = {}
+        errores = dict(self._invalidos)
+        rangos = {}  # (hoja, partes) -> _RangoNumerico, compartido por los agregados del mismo rango
+        for encabezado, hoja, partes, tipo in self._entradas:
+            bloque = bloques[hoja]
+            if isinstance(bloque, Exception):
+                errores[encabezado] = bloque
+                valores.pop(encabezado, None)
+                continue
+            try:
+                rango = None
+                if tipo != "valor":
+                    clave = (hoja, tuple(partes))
+                    rango = rangos.get(clave)
+                    if rango is None:
+                        rango = rangos[clave] = self._numeros(bloque, self._cajas[hoja], partes)
+                valores[encabezado] = self._evaluar(bloque, self._cajas[hoja], partes, tipo, decimales_config, rango)
+                errores.pop(encabezado, None)
+            except Exception as e:
+                errores[encabezado] = e
+                valores.pop(encabezado, None)
+        return valores, errores
+
+def extraer_dato_excel_mejorado(excel_path, hoja, celda, tipo, decimales_config, sesion=None, solo_lectura=False, cache=None):
+    """
+    Extrae un valor o calcula promedio según 'tipo' desde excel_path.
+    - celda soporta: "A1", "A1:A10", "C5,E7,F9", "C5:E10".
+    - tipo: "valor" (devuelve primera celda válida) o un agregado numérico del rango:
+      "promedio", "min", "max", "std" (muestral), "mediana", "suma", "conteo".
+    - sesion: SesionExcel opcional; si se indica, el libro se reutiliza entre llamadas.
+    - solo_lectura: sin sesión, abre el libro en modo streaming (read_only) y lo cierra al terminar.
+    - cache: CacheValores opcional; si el libro no cambió no se abre.
+    Para muchos mapeos sobre el mismo libro conviene usar PlanExtraccion directamente.
+    """
+    plan = PlanExtraccion([{"encabezado": celda, "hoja": hoja, "celda": celda, "tipo": tipo}])
+    guardado = cache.consultar(plan, excel_path, decimales_config) if cache is not None else None
+    if guardado is not None:
+        valores, errores = guardado
+    elif sesion is not None:
+        wb = sesion.abrir(excel_path)
+        valores, errores = plan.extraer(wb, decimales_config, os.path.basename(excel_path))
+    else:
+        wb = load_workbook(excel_path, read_only=solo_lectura, data_only=True)
+        try:
+            valores, errores = plan.extraer(wb, decimales_config, os.path.basename(excel_path))
+        finally:
+            if solo_lectura:
+                wb.close()
+    if guardado is None and cache is not None:
+        cache.guardar(plan, excel_path, decimales_config, valores, errores)
+    if celda in errores:
+        raise errores[celda]
+    return valores[celda]
+
+class CacheValores:
+    """
+    Caché en disco (SQLite) de los valores extraídos de cada libro Excel.
+    Un valor se reutiliza mientras el libro conserve ruta, tamaño y fecha de
+    modificación y no cambien la hoja, las celdas, el tipo ni los decimales del
+    mapeo: regenerar tras cambiar solo la plantilla no vuelve a abrir ningún Excel.
+    También se guardan los errores de extracción (p. ej. hoja inexistente), que
+    dependen solo del libro y se repiten mientras no cambie.
+    """
+
+    NOMBRE = ".cache_valores.sqlite"
+    # se incrementa cuando cambia cómo se calcula algún valor; una caché de otro formato se vacía
+    FORMATO = 2
+
+    def __init__(self, ruta, activo=True):
+        self.ruta = ruta
+        self.activo = bool(activo and ruta)
+        self._con = None
+        self.estadisticas = {"aciertos": 0, "lecturas": 0}
+
+    @classmethod
+    def desde_config(cls, config):
+        xc = config.get("excel_config", {})
+        ruta = xc.get("ruta_cache") or (os.path.join(config["output_folder"], cls.NOMBRE) if config.get("output_folder") else "")
+        return cls(ruta, xc.get("cache_valores", True))
+
+    def _conexion(self):
+        if self._con is None:
+            carpeta = os.path.dirname(self.ruta)
+            if carpeta:
+                os.makedirs(carpeta, exist_ok=True)
+            # los procesos de trabajo comparten el archivo; SQLite serializa las escrituras
+            # check_same_thread=False: en modo pipeline la usa el hilo de lectura y la cierra el principal
+            self._con = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+            if self._con.execute("PRAGMA user_version").fetchone()[0] != self.FORMATO:
+                with self._con:
+                    self._con.execute("DROP TABLE IF EXISTS valores")
+                    self._con.execute(f"PRAGMA user_version = {int(self.FORMATO)}")
+            self._con.execute("CREATE TABLE IF NOT EXISTS valores (libro TEXT, tam INTEGER, mtime_ns INTEGER,"
+                              " clave TEXT, decimales TEXT, valor TEXT, PRIMARY KEY (libro, clave, decimales))")
+        return self._con
+
+    @staticmethod
+    def _firma(excel_path, decimales_config):
+        st = os.stat(excel_path)
+        decimales = json.dumps([bool(decimales_config.get("usar_decimales_fijos", False)),
+                                int(decimales_config.get("cantidad_decimales", 1))])
+        return os.path.abspath(excel_path), st.st_size, st.st_mtime_ns, decimales
+
+    def consultar(self, plan, excel_path, decimales_config):
+        """(valores, errores) del plan si todos están en caché para este libro; si no, None."""
+        if not self.activo:
+            return None
+        try:
+            libro, tam, mtime_ns, decimales = self._firma(excel_path, decimales_config)
+            filas = self._conexion().execute(
+                "SELECT clave, valor FROM valores WHERE libro = ? AND tam = ? AND mtime_ns = ? AND decimales = ?",
+                (libro, tam, mtime_ns, decimales)).fetchall()
+        except (OSError, sqlite3.Error):
+            return None
+        guardados = dict(filas)
+        claves = plan.claves()
+        if not claves or any(clave not in guardados for _enc, clave in claves):
+            return None
+        self.estadisticas["aciertos"] += 1
+        valores = {}
+        errores = plan.errores_compilacion()
+        for enc, clave in claves:
+            guardado = json.loads(guardados[clave])
+            if "error" in guardado:
+                errores[enc] = ValueError(guardado["error"])
+            else:
+                valores[enc] = guardado["valor"]
+        return valores, errores
+
+    def guardar(self, plan, excel_path, decimales_config, valores, errores):
+        """
+        Guarda lo recién extraído y descarta lo de versiones anteriores del libro.
+        Solo se guardan resultados repetibles (valores, hojas inexistentes, celdas
+        inválidas...): si alguna hoja no se pudo leer el libro no se guarda y la
+        próxima ejecución lo vuelve a abrir.
+        """
+        self.estadisticas["lecturas"] += 1
+        if not self.activo:
+            return
+        if any(isinstance(e, ErrorLecturaHoja) for e in errores.values()):
+            return
+        try:
+            libro, tam, mtime_ns, decimales = self._firma(excel_path, decimales_config)
+            filas = []
+            for enc, clave in plan.claves():
+                if enc in valores:
+                    guardado = {"valor": valores[enc]}
+                elif enc in errores:
+                    guardado = {"error": str(errores[enc])}
+                else:
+                    continue
+                filas.append((libro, tam, mtime_ns, clave, decimales, json.dumps(guardado, ensure_ascii=False, default=str)))
+            con = self._conexion()
+            with con:
+                con.execute("DELETE FROM valores WHERE libro = ? AND (tam != ? OR mtime_ns != ?)", (libro, tam, mtime_ns))
+                con.executemany("INSERT OR REPLACE INTO valores VALUES (?, ?, ?, ?, ?, ?)", filas)
+        except (OSError, sqlite3.Error):
+            # la caché es solo una optimización: si no se puede escribir se sigue sin ella
+            self.activo = False
+
+    @staticmethod
+    def formatear_resumen(est):
+        return f"{est['aciertos']} libros desde caché, {est['lecturas']} leídos"
+
+    def resumen(self):
+        return self.formatear_resumen(self.estadisticas)
+
+    def cerrar(self):
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+class DatasetCalicatas:
+    """
+    Valores extraídos de una campaña en un CSV (una fila por calicata, una columna
+    por encabezado). La etapa "extract" lo escribe leyendo cada Excel una vez; la
+    etapa "render" genera los informes solo a partir de él, sin abrir ningún Excel.
+    Columnas: calicata, <encabezados...>, excel, error (la calicata no pudo leerse)
+    y errores (JSON encabezado -> mensaje de los mapeos que fallaron).
+    Los valores se guardan como texto, igual que se escriben en el Word.
+    """
+
+    NOMBRE = "datos_calicatas.csv"
+
+    def __init__(self, encabezados):
+        self.encabezados = list(encabezados)
+        self.filas = {}  # numero -> {"excel", "error", "errores", "valores"}
+
+    @classmethod
+    def ruta_por_defecto(cls, config):
+        return os.path.join(config["output_folder"], cls.NOMBRE)
+
+    @classmethod
+    def desde_config(cls, config):
+        """Dataset indicado en procesamiento_config.dataset (modo render) o None."""
+        ruta = config.get("procesamiento_config", {}).get("dataset")
+        return cls.leer(ruta) if ruta else None
+
+    def agregar(self, numero, excel=None, valores=None, errores=None, error=None):
+        self.filas[numero] = {"excel": excel or "", "error": error or "",
+                              "errores": {enc: str(e) for enc, e in (errores or {}).items()},
+                              "valores": {enc: "" if v is None else str(v) for enc, v in (valores or {}).items()}}
+
+    def escribir(self, ruta):
+        tmp = ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["calicata"] + self.encabezados + ["excel", "error", "errores"])
+            for numero, fila in sorted(self.filas.items()):
+                w.writerow([f"C-{numero:02d}"] + [fila["valores"].get(enc, "") for enc in self.encabezados]
+                           + [fila["excel"], fila["error"], json.dumps(fila["errores"], ensure_ascii=False) if fila["errores"] else ""])
+        os.replace(tmp, ruta)
+
+    @classmethod
+    def leer(cls, ruta):
+        with open(ruta, "r", encoding="utf-8", newline="") as f:
+            lector = csv.reader(f)
+            cabecera = next(lector, None)
+            if not cabecera or cabecera[0] != "calicata" or cabecera[-3:] != ["excel", "error", "errores"]:
+                raise ValueError(f"{os.path.basename(ruta)} no es un dataset de calicatas")
+            dataset = cls(cabecera[1:-3])
+            for celdas in lector:
+                if not celdas:
+                    continue
+                m = re.fullmatch(r"C-(\d+)", celdas[0].strip())
+                if not m:
+                    continue
+                n = len(dataset.encabezados)
+                errores = json.loads(celdas[n + 3]) if len(celdas) > n + 3 and celdas[n + 3] else {}
+                dataset.filas[int(m.group(1))] = {
+                    "valores": {enc: v for enc, v in zip(dataset.encabezados, celdas[1:n + 1]) if enc not in errores},
+                    "excel": celdas[n + 1] if len(celdas) > n + 1 else "",
+                    "error": celdas[n + 2] if len(celdas) > n + 2 else "",
+                    "errores": errores}
+        return dataset
+
+    def tiene_excel(self, numero):
+        """False si en la extracción no se encontró Excel para la calicata (o no está en el dataset)."""
+        fila = self.filas.get(numero)
+        return bool(fila and (fila["excel"] or fila["error"]))
+
+    def datos(self, numero, encabezados):
+        """
+        (valores, errores) de la calicata para los encabezados pedidos, como
+        PlanExtraccion.extraer. Lanza excepción si la calicata no tenía Excel o no pudo leerse.
+        """
+        calicata = f"C-{numero:02d}"
+        fila = self.filas.get(numero)
+        if fila is None:
+            raise KeyError(f"{calicata} no está en el dataset")
+        if fila["error"]:
+            raise ValueError(fila["error"])
+        if not fila["excel"]:
+            raise FileNotFoundError(f"No se encontró archivo Excel para {calicata}")
+        valores = {}
+        errores = {}
+        for enc in encabezados:
+            if enc in fila["errores"]:
+                errores[enc] = ValueError(fila["errores"][enc])
+            elif enc in fila["valores"]:
+                valores[enc] = fila["valores"][enc]
+            else:
+                errores[enc] = KeyError(f"'{enc}' no está en el dataset")
+        return valores, errores
+
+    def huella(self, numero):
+        """Contenido de la fila de 'numero' (para el manifiesto del modo incremental)."""
+        return json.dumps(self.filas.get(numero), sort_keys=True, ensure_ascii=False)
+
+    def resumen(self):
+        return f"{len(self.filas)} calicatas × {len(self.encabezados)} encabezados"
+
+# ---------------------------
+# Configuración
+# ---------------------------
+
+def config_por_defecto():
+    """Configuración inicial (misma estructura que el JSON de guardar_config_json)."""
+    return {
+        "docx_path": "",
+        "excel_folder_1": "",
+        "excel_folder_2": "",
+        "output_folder": "",
+        "mappings": [],  # {"encabezado","hoja","celda","tipo"}
+        "text_replacements": [],  # list of tuples
+        "imagenes_folder": "",
+        "image_replacements": [],
+        "fixed_image_height": 5.0,
+        "font_config": {
+            "paragraph_font": "Calibri",
+            "paragraph_size": 11,
+            "table_font": "Calibri",
+            "table_size": 11
+        },
+        "archivo_config": {
+            "nombre_base": "EMS CUSCO C-",
+            "usar_sufijo": True,
+            "sufijo_personalizado": "",
+            "nivel_compresion": 6
+        },
+        "imagen_config": {
+            "usar_mapeo_automatico": False,
+            "imagen_mapeos": [],
+            "optimizar": True,
+            "dpi": 200,
+            "calidad_jpeg": 85,
+            "carpeta_cache": ""
+        },
+        "informe_config": {
+            "tipo_informe": "individual",
+            "consolidado_nombre": "Informe_Consolidado"
+        },
+        "decimales_config": {
+            "usar_decimales_fijos": True,
+            "cantidad_decimales": 1
+        },
+        "excel_config": {
+            "modo_lectura": "completo",
+            "medir_recursos": False,
+            "patrones": ["{calicata}.xlsx"],
+            "recursivo": False,
+            "cache_valores": True,
+            "ruta_cache": ""
+        },
+        "procesamiento_config": {
+            "procesos": 1,
+            "incremental": False,
+            "medir_etapas": False,
+            "perfilar": False,
+            "dataset": "",
+            "pipeline": False,
+            "anticipacion": 3,
+            "hilos_escritura": 2
+        },
+        "reemplazo_config": {
+            "conservar_formato": False
+        },
+        "log_config": {
+            "nivel": "detalle",
+            "lineas_visibles": 2000
+        }
+    }
+
+# niveles del log; "detalle" incluye cada mapeo, imagen y guardado de cada calicata
+NIVELES_LOG = {"avisos": logging.WARNING, "normal": logging.INFO, "detalle": logging.DEBUG}
+
+def nivel_log(config):
+    return NIVELES_LOG.get(config.get("log_config", {}).get("nivel", "detalle"), logging.DEBUG)
+
+def ruta_log_por_defecto():
+    return os.path.join(os.path.expanduser("~"), ".generador_informes", "generador_informes.log")
+
+def crear_log_archivo(ruta, max_bytes=5 * 1048576, copias=3):
+    """Logger que escribe cada línea (ya con fecha) en un archivo rotativo. Devuelve (logger, handler)."""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    handler = RotatingFileHandler(ruta, maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger = logging.getLogger(f"generador_informes.{ruta}")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger, handler
+
+def archivos_log(handler):
+    """Archivos del log rotativo de más antiguo a más reciente."""
+    base = handler.baseFilename
+    archivos = [f"{base}.{i}" for i in range(handler.backupCount, 0, -1)] + [base]
+    return [a for a in archivos if os.path.exists(a)]
+
+def cargar_config(path):
+    """Leer un JSON de guardar_config_json completando las claves que falten."""
+    config = config_por_defecto()
+    with open(path, "r", encoding="utf-8") as f:
+        config.update(json.load(f))
+    return config
+
+def validar_config(config):
+    """Validación mínima para ejecutar sin GUI. Devuelve lista de errores."""
+    errs = []
+    if not config.get("docx_path") or not os.path.exists(config["docx_path"]):
+        errs.append("- Documento Word base inválido (docx_path).")
+    if not (config.get("excel_folder_1") or config.get("excel_folder_2") or config.get("procesamiento_config", {}).get("dataset")):
+        errs.append("- Falta al menos una carpeta de Excel (excel_folder_1/excel_folder_2).")
+    if not config.get("output_folder") or not os.path.exists(config["output_folder"]):
+        errs.append("- Carpeta de salida inválida (output_folder).")
+    if not config.get("mappings"):
+        errs.append("- Configure al menos un mapeo Excel ↔ Word (mappings).")
+    for patron in config.get("excel_config", {}).get("patrones") or []:
+        try:
+            patron.format(calicata="C-01", num=1)
+        except (KeyError, IndexError, ValueError):
+            errs.append(f"- Patrón de archivo Excel inválido: {patron} (use {{calicata}} o {{num}}).")
+    return errs
+
+# ---------------------------
+# Generación de informes (sin GUI; compartida por la app y los procesos de trabajo)
+# ---------------------------
+
+def buscar_archivo_excel(carpetas, calicata):
+    """Buscar calicata.xlsx en las carpetas indicadas (en orden de prioridad)."""
+    for carpeta in carpetas:
+        if carpeta and os.path.exists(carpeta):
+            candidate = os.path.join(carpeta, f"{calicata}.xlsx")
+            if os.path.exists(candidate):
+                return candidate
+    return None
+
+class IndiceExcel:
+    """
+    Índice de los libros Excel de las carpetas configuradas, construido una vez
+    por ejecución con os.scandir (un listado por carpeta en lugar de un stat por
+    calicata y carpeta). Los nombres esperados salen de 'patrones' (str.format con
+    {calicata} = "C-01" y {num} = 1), p. ej. "{calicata}.xlsx" o "C-{num:02d} ensayo.xlsx".
+    Si un nombre aparece en varias carpetas gana la primera (orden de prioridad).
+    Es serializable: se construye en el proceso principal y se pasa a los de trabajo.
+    """
+
+    PATRONES = ("{calicata}.xlsx",)
+
+    def __init__(self, carpetas, patrones=None, recursivo=False):
+        self.carpetas = [c for c in carpetas if c]
+        self.patrones = list(patrones or self.PATRONES)
+        self.recursivo = recursivo
+        self.archivos = {}  # nombre en minúsculas -> [rutas en orden de prioridad]
+        t0 = time.perf_counter()
+        vistas = set()
+        for carpeta in self.carpetas:
+            self._indexar(carpeta, vistas)
+        self.segundos = time.perf_counter() - t0
+
+    @classmethod
+    def desde_config(cls, config):
+        xc = config.get("excel_config", {})
+        return cls([config.get("excel_folder_1", ""), config.get("excel_folder_2", "")],
+                   xc.get("patrones"), xc.get("recursivo", False))
+
+    def _indexar(self, carpeta, vistas):
+        pendientes = [carpeta]
+        while pendientes:
+            actual = pendientes.pop(0)
+            clave = os.path.normcase(os.path.abspath(actual))
+            # la misma carpeta configurada dos veces (o una dentro de otra) se lista una vez
+            if clave in vistas:
+                continue
+            vistas.add(clave)
+            try:
+                with os.scandir(actual) as it:
+                    entradas = sorted(it, key=lambda e: e.name)
+            except OSError:
+                continue
+            for e in entradas:
+                try:
+                    if e.is_file():
+                        self.archivos.setdefault(e.name.lower(), []).append(e.path)
+                    elif self.recursivo and e.is_dir():
+                        pendientes.append(e.path)
+                except OSError:
+                    continue
+
+    def candidatos(self, numero):
+        """Todas las rutas que corresponden a la calicata 'numero' (la primera es la que se usa)."""
+        calicata = f"C-{numero:02d}"
+        rutas = []
+        for patron in self.patrones:
+            for ruta in self.archivos.get(patron.format(calicata=calicata, num=numero).lower(), []):
+                if ruta not in rutas:
+                    rutas.append(ruta)
+        return rutas
+
+    def ruta(self, numero):
+        rutas = self.candidatos(numero)
+        return rutas[0] if rutas else None
+
+    def revisar(self, start_val, end_val):
+        """Devuelve (faltantes, duplicados) del rango: ["C-03", ...], {"C-05": [rutas]}."""
+        faltantes = []
+        duplicados = {}
+        for numero in range(start_val, end_val + 1):
+            rutas = self.candidatos(numero)
+            if not rutas:
+                faltantes.append(f"C-{numero:02d}")
+            elif len(rutas) > 1:
+                duplicados[f"C-{numero:02d}"] = rutas
+        return faltantes, duplicados
+
+    def resumen(self):
+        total = sum(len(rutas) for rutas in self.archivos.values())
+        return f"{total} archivos en {len(self.carpetas)} carpetas ({self.segundos:.2f} s)"
+
+def seleccionar_imagen_por_subcarpeta(root_folder, sub_num):
+    """
+    Busca subcarpeta que contenga el número indicado (ej: '01', 'C-01', 'Imágenes 01').
+    Si no encuentra, intenta seleccionar por orden de modificación.
+    """
+    if not os.path.exists(root_folder):
+        return None
+    # buscar subcarpeta con número
+    entries = [d for d in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, d))]
+    # prefer exact numeric suffixes or contains numeric sequence
+    pattern = re.compile(r"(\d{1,3})")
+    for d in entries:
+        m = pattern.search(d)
+        if m:
+            if int(m.group(1)) == sub_num:
+                return os.path.join(root_folder, d)
+    # fallback: orden por fecha
+    try:
+        entries_full = [os.path.join(root_folder, d) for d in entries]
+        entries_full.sort(key=lambda x: os.path.getmtime(x))
+        idx = sub_num - 1
+        if idx < len(entries_full):
+            return entries_full[idx]
+    except Exception:
+        pass
+    return None
+
+def obtener_imagenes_ordenadas(subcarpeta):
+    if not subcarpeta or not os.path.exists(subcarpeta):
+        return []
+    files = [os.path.join(subcarpeta, f) for f in os.listdir(subcarpeta) if f.lower().endswith(EXTENSIONES_IMAGEN)]
+    files.sort(key=lambda x: os.path.getmtime(x))
+    return files
+
+class IndiceImagenes:
+    """
+    Índice de la carpeta raíz de imágenes para toda la ejecución: la raíz se lista
+    una sola vez (número -> subcarpeta, más el orden por fecha para el respaldo) y
+    cada subcarpeta se lista la primera vez que se pide, guardando sus fotos ya
+    ordenadas. Mismas reglas que seleccionar_imagen_por_subcarpeta y
+    obtener_imagenes_ordenadas, con los stat de os.scandir.
+    Es serializable: se precarga en el proceso principal y se pasa a los de trabajo.
+    """
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+        self._por_numero = None
+        self._por_fecha = None
+        self._fotos = {}  # subcarpeta -> [rutas ordenadas por fecha]
+        self._firmas = {}  # ruta -> (mtime_ns, tamaño) del listado
+
+    @classmethod
+    def desde_config(cls, config):
+        return cls(config.get("imagenes_folder", ""))
+
+    def _indexar_raiz(self):
+        self._por_numero = {}
+        self._por_fecha = []
+        if not self.raiz or not os.path.isdir(self.raiz):
+            return
+        patron = re.compile(r"(\d{1,3})")
+        fechas = []
+        with os.scandir(self.raiz) as it:
+            for e in sorted(it, key=lambda e: e.name):
+                try:
+                    if not e.is_dir():
+                        continue
+                    fechas.append((e.stat().st_mtime, e.path))
+                except OSError:
+                    continue
+                m = patron.search(e.name)
+                if m:
+                    # la primera subcarpeta con ese número gana
+                    self._por_numero.setdefault(int(m.group(1)), e.path)
+        fechas.sort(key=lambda x: x[0])
+        self._por_fecha = [ruta for _fecha, ruta in fechas]
+
+    def subcarpeta(self, numero):
+        """Subcarpeta de la calicata 'numero' (por número en el nombre o, si no, por fecha)."""
+        if self._por_numero is None:
+            self._indexar_raiz()
+        ruta = self._por_numero.get(numero)
+        if ruta is None and 0 < numero <= len(self._por_fecha):
+            ruta = self._por_fecha[numero - 1]
+        return ruta
+
+    def imagenes(self, subcarpeta):
+        """Fotos de la subcarpeta ordenadas por fecha de modificación (más antigua primero)."""
+        if not subcarpeta:
+            return []
+        fotos = self._fotos.get(subcarpeta)
+        if fotos is None:
+            encontradas = []
+            try:
+                with os.scandir(subcarpeta) as it:
+                    for e in it:
+                        if e.name.lower().endswith(EXTENSIONES_IMAGEN):
+                            try:
+                                st = e.stat()
+                            except OSError:
+                                continue
+                            encontradas.append((st.st_mtime, e.name, e.path))
+                            self._firmas[e.path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                pass
+            encontradas.sort()
+            fotos = self._fotos[subcarpeta] = [ruta for _fecha, _nombre, ruta in encontradas]
+        return fotos
+
+    def firma(self, ruta):
+        """(mtime_ns, tamaño) de una foto ya listada por imagenes()."""
+        return self._firmas.get(ruta)
+
+    def precargar(self, start_val, end_val):
+        """Lista de una vez las subcarpetas del rango (antes de repartirlo entre procesos)."""
+        for numero in range(start_val, end_val + 1):
+            self.imagenes(self.subcarpeta(numero))
+        return self
+
+    def resumen(self):
+        if self._por_numero is None:
+            self._indexar_raiz()
+        total = sum(len(f) for f in self._fotos.values())
+        return f"{len(self._por_fecha)} subcarpetas, {total} fotos en {len(self._fotos)} subcarpetas del rango"
+
+def altura_imagenes(config):
+    """Altura fija (cm) con que se insertan las fotos."""
+    try:
+        return float(config.get("fixed_image_height", 5.0))
+    except Exception:
+        return 5.0
+
+def procesar_imagenes_calicata(doc, calicata, numero, config, log, indice=None, cache=None, carpetas=None):
+    """
+    Reemplazos según mapeo automático (imagen_config.imagen_mapeos):
+      - Busca la subcarpeta correspondiente (por número).
+      - Reemplaza las imágenes por orden (más antigua -> primero).
+      - Con un CacheImagenes se inserta la copia reducida a la altura fija.
+      - Con un IndiceImagenes (de la ejecución) no se vuelve a listar la carpeta.
+    """
+    root = config.get("imagenes_folder", "")
+    if not root or not os.path.exists(root):
+        log(f"⚠️ No hay carpeta de imágenes configurada.", logging.WARNING)
+        return
+    if carpetas is None:
+        carpetas = IndiceImagenes(root)
+    subcarpeta = carpetas.subcarpeta(numero)
+    if not subcarpeta or not os.path.exists(subcarpeta):
+        log(f"⚠️ No se encontró subcarpeta para {calicata} (buscando {numero}).", logging.WARNING)
+        return
+    imgs = carpetas.imagenes(subcarpeta)
+    if not imgs:
+        log(f"⚠️ Subcarpeta {os.path.basename(subcarpeta)} no contiene imágenes.", logging.WARNING)
+        return
+
+    imgs_doc = indice.resolver_imagenes(doc) if indice is not None else listar_imagenes_doc(doc)
+    for m in config["imagen_config"].get("imagen_mapeos", []):
+        pos = m.get("posicion", 1) - 1
+        subidx = m.get("imagen_subcarpeta", 1) - 1
+        # elegir imagen en la subcarpeta según índice
+        if subidx < 0 or subidx >= len(imgs):
+            log(f"⚠️ Sub índice {subidx+1} fuera de rango en subcarpeta {subcarpeta}", logging.WARNING)
+            continue
+        if pos < 0 or pos >= len(imgs_doc):
+            log(f"⚠️ Posición imagen {pos+1} no encontrada en el documento", logging.WARNING)
+            continue
+        ruta_nueva = imgs[subidx]
+        info = imgs_doc[pos]
+        try:
+            fixed_h = altura_imagenes(config)
+            ruta_insertar = cache.preparar(ruta_nueva, fixed_h) if cache is not None else ruta_nueva
+            reemplazar_imagen(info["run"], ruta_insertar, fixed_h)
+            log(f"🖼️ Imagen {pos+1} reemplazada por {os.path.basename(ruta_nueva)}", logging.DEBUG)
+        except Exception as e:
+            log(f"⚠️ Error reemplazando imagen {pos+1}: {str(e)}", logging.WARNING)
+
+def guardar_docx(doc, outpath, nivel_compresion=6):
+    """
+    Guarda 'doc' de forma atómica: se escribe en un temporal de la misma carpeta
+    y se renombra sobre 'outpath' (os.replace), así una ejecución detenida o
+    caída nunca deja un .docx a medias. Devuelve el tamaño en bytes.
+    El nivel de compresión del zip va de 0 (sin comprimir) a 9 (el más pequeño);
+    con 6, el de python-docx, se guarda tal cual con doc.save(); con otro nivel
+    se guarda en memoria y se vuelve a comprimir entrada por entrada.
+    """
+    nivel = min(max(int(nivel_compresion), 0), 9)
+    tmp = f"{outpath}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if nivel == 6:
+            doc.save(tmp)
+        else:
+            buffer = io.BytesIO()
+            doc.save(buffer)
+            compresion = zipfile.ZIP_DEFLATED if nivel else zipfile.ZIP_STORED
+            with zipfile.ZipFile(buffer) as origen, \
+                    zipfile.ZipFile(tmp, "w", compression=compresion, compresslevel=nivel or None) as destino:
+                for entrada in origen.infolist():
+                    destino.writestr(entrada.filename, origen.read(entrada))
+        tam = os.path.getsize(tmp)
+        os.replace(tmp, outpath)
+        return tam
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def nivel_compresion(config):
+    return config.get("archivo_config", {}).get("nivel_compresion", 6)
+
+def generar_nombre_archivo(archivo_config, numero):
+    base = archivo_config.get("nombre_base", "")
+    if archivo_config.get("usar_sufijo", True):
+        return f"{base}{numero:02d}"
+    s = archivo_config.get("sufijo_personalizado", "")
+    return f"{base}{s}" if s else base
+
+def _percentil(ordenados, p):
+    """Percentil p (0-100) con interpolación lineal sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    siguiente = ordenados[min(i + 1, len(ordenados) - 1)]
+    return ordenados[i] + (siguiente - ordenados[i]) * (k - i)
+
+class MedidorEtapas:
+    """
+    Tiempo de cada etapa por calicata y resumen de la ejecución (total, media,
+    p50/p90/p99, máximo por etapa), exportable a JSON/CSV. En el consolidado las
+    etapas del documento único (plantilla, tablas, imágenes, guardado) van en la
+    fila DOCUMENTO y cada calicata solo lleva su extracción.
+    Inactivo no mide nada: etapa() devuelve un contexto vacío.
+    """
+
+    ETAPAS = ("plantilla", "reemplazos", "formato", "excel_abrir", "extraccion",
+              "insertar_tablas", "imagenes", "guardado")
+    DOCUMENTO = 0  # las calicatas se numeran desde 1
+    _SIN_MEDIR = contextlib.nullcontext()
+
+    def __init__(self, activo=False):
+        self.activo = activo
+        self.calicatas = {}  # numero -> {etapa: segundos}
+        self._actual = None
+
+    def iniciar(self, numero):
+        if self.activo:
+            self._actual = self.calicatas.setdefault(numero, {})
+
+    def terminar(self):
+        """Cierra la calicata en curso y devuelve sus tiempos (None si inactivo)."""
+        tiempos, self._actual = self._actual, None
+        return tiempos
+
+    def agregar(self, numero, tiempos):
+        """Incorporar los tiempos medidos en otro proceso."""
+        if tiempos is not None:
+            self.calicatas[numero] = tiempos
+
+    def sumar(self, numero, etapa, segundos):
+        """Añadir a una calicata ya cerrada el tiempo de una etapa medida en otro hilo."""
+        tiempos = self.calicatas.get(numero)
+        if self.activo and tiempos is not None:
+            tiempos[etapa] = tiempos.get(etapa, 0.0) + segundos
+
+    def etapa(self, nombre):
+        if self._actual is None:
+            return self._SIN_MEDIR
+        return self._medir(nombre)
+
+    @contextlib.contextmanager
+    def _medir(self, nombre):
+        actual = self._actual
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            actual[nombre] = actual.get(nombre, 0.0) + time.perf_counter() - t0
+
+    def resumen(self):
+        """{etapa: {n, total, media, p50, p90, p99, max}} incluyendo 'total' por calicata."""
+        columnas = {e: [] for e in self.ETAPAS}
+        columnas["total"] = []
+        for tiempos in self.calicatas.values():
+            for etapa, seg in tiempos.items():
+                columnas.setdefault(etapa, []).append(seg)
+            columnas["total"].append(sum(tiempos.values()))
+        resumen = {}
+        for etapa, valores in columnas.items():
+            if not valores:
+                continue
+            valores.sort()
+            resumen[etapa] = {"n": len(valores), "total": sum(valores), "media": sum(valores) / len(valores),
+                              "p50": _percentil(valores, 50), "p90": _percentil(valores, 90),
+                              "p99": _percentil(valores, 99), "max": valores[-1]}
+        return resumen
+
+    def lineas_resumen(self):
+        """Texto para el log: etapas de mayor a menor tiempo total."""
+        resumen = self.resumen()
+        total = resumen.get("total", {}).get("total", 0.0) or 1.0
+        lineas = []
+        for etapa, r in sorted(resumen.items(), key=lambda x: -x[1]["total"]):
+            if etapa == "total":
+                continue
+            lineas.append(f"  {etapa}: {r['total']:.2f} s ({r['total'] / total * 100:.0f}%),"
+                          f" p50 {r['p50'] * 1000:.0f} ms, p90 {r['p90'] * 1000:.0f} ms, máx {r['max'] * 1000:.0f} ms")
+        return lineas
+
+    @classmethod
+    def etiqueta(cls, numero):
+        return "documento" if numero == cls.DOCUMENTO else f"C-{numero:02d}"
+
+    def exportar(self, carpeta, extra=None):
+        """Escribe rendimiento_<fecha>.json y .csv en 'carpeta'. Devuelve las dos rutas."""
+        base = os.path.join(carpeta, f"rendimiento_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        etapas = list(self.ETAPAS) + sorted({e for t in self.calicatas.values() for e in t} - set(self.ETAPAS))
+        datos = {"fecha": datetime.now().isoformat(timespec="seconds"), "resumen": self.resumen(),
+                 "calicatas": {self.etiqueta(n): t for n, t in sorted(self.calicatas.items())}}
+        datos.update(extra or {})
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=1)
+        with open(base + ".csv", "w", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["calicata"] + etapas + ["total"])
+            for n, tiempos in sorted(self.calicatas.items()):
+                w.writerow([self.etiqueta(n)] + [f"{tiempos.get(e, 0.0):.6f}" for e in etapas] + [f"{sum(tiempos.values()):.6f}"])
+        return base + ".json", base + ".csv"
+
+class RecursosEjecucion:
+    """
+    Objetos compartidos por todas las calicatas de una ejecución: plantilla en
+    memoria, plan de extracción y sesión Excel. Cada proceso de trabajo crea los suyos.
+    """
+
+    def __init__(self, config, indice_excel=None, indice_imagenes=None, dataset=None):
+        self.config = config
+        # modo render: los valores salen del dataset y no se abre ningún Excel
+        self.dataset = dataset if dataset is not None else DatasetCalicatas.desde_config(config)
+        self.excel = indice_excel if indice_excel is not None else IndiceExcel.desde_config(config)
+        self.indice_imagenes = indice_imagenes if indice_imagenes is not None else IndiceImagenes.desde_config(config)
+        self.plantilla = PlantillaWord(config["docx_path"])
+        self.plan = PlanExtraccion(config.get("mappings", []))
+        self._indice = None
+        excel_cfg = config.get("excel_config", {})
+        self.sesion = SesionExcel(excel_cfg.get("modo_lectura") == "streaming", excel_cfg.get("medir_recursos", False))
+        self.cache_valores = CacheValores.desde_config(config)
+        self.cache_imagenes = CacheImagenes.desde_config(config)
+        self.guardado = {"archivos": 0, "bytes": 0, "segundos": 0.0}
+        self.etapas = MedidorEtapas(config.get("procesamiento_config", {}).get("medir_etapas", False))
+
+    @property
+    def indice(self):
+        """IndicePlantilla para el flujo individual (calculado la primera vez que se pide)."""
+        if self._indice is None:
+            buscados = ["C-01"] + [str(old) for old, _new in self.config.get("text_replacements", [])]
+            self._indice = IndicePlantilla(self.plantilla.nuevo_documento(), buscados)
+        return self._indice
+
+    def extraer(self, excel_path, etapas=None, log=None):
+        """
+        Valores del plan para un libro: desde la caché de valores si el libro no
+        cambió; si no, abriéndolo en la sesión. Devuelve (valores, errores).
+        El libro se libera en cuanto se extraen los valores, así la medición de
+        la sesión (tiempo y pico de memoria, a 'log') cubre solo el trabajo Excel.
+        'etapas' sustituye al medidor de la ejecución (p. ej. uno inactivo desde otro hilo).
+        """
+        etapas = etapas if etapas is not None else self.etapas
+        decimales = self.config["decimales_config"]
+        with etapas.etapa("extraccion"):
+            guardado = self.cache_valores.consultar(self.plan, excel_path, decimales)
+        if guardado is not None:
+            return guardado
+        try:
+            with etapas.etapa("excel_abrir"):
+                wb = self.sesion.abrir(excel_path)
+            with etapas.etapa("extraccion"):
+                valores, errores = self.plan.extraer(wb, decimales, os.path.basename(excel_path))
+        finally:
+            medicion = self.sesion.liberar(excel_path)
+            if medicion and log is not None:
+                log(f"  {SesionExcel.formatear_medicion(medicion)}", logging.DEBUG)
+        with etapas.etapa("extraccion"):
+            self.cache_valores.guardar(self.plan, excel_path, decimales, valores, errores)
+        return valores, errores
+
+    def registrar_guardado(self, tam, segundos):
+        self.guardado["archivos"] += 1
+        self.guardado["bytes"] += tam
+        self.guardado["segundos"] += segundos
+
+    @staticmethod
+    def formatear_guardado(g):
+        if not g["archivos"]:
+            return "sin archivos"
+        return (f"{g['archivos']} archivos, {formatear_bytes(g['bytes'])} en total"
+                f" ({formatear_bytes(g['bytes'] / g['archivos'])}/archivo), guardado {g['segundos']:.2f} s")
+
+    def cerrar(self):
+        self.sesion.cerrar()
+        self.cache_valores.cerrar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
+
+def generar_informe_individual(recursos, numero, log, leido=None, escritor=None):
+    """
+    Genera el informe .docx de una calicata y devuelve la ruta de salida.
+    Lanza excepción si la calicata no puede generarse; los avisos van a 'log'.
+    En modo pipeline 'leido' trae los valores y fotos ya preparados por
+    LecturaAnticipada. Con un EscritorInformes el documento se encola para
+    guardarlo en segundo plano (la ruta se devuelve antes de que exista).
+    """
+    config = recursos.config
+    calicata = f"C-{numero:02d}"
+    etapas = recursos.etapas
+    with etapas.etapa("plantilla"):
+        doc = recursos.plantilla.nuevo_documento()
+        indice = recursos.indice
+    # reemplazar marcador base y luego los reemplazos en orden (un solo recorrido)
+    conservar = config.get("reemplazo_config", {}).get("conservar_formato", False)
+    with etapas.etapa("reemplazos"):
+        reemplazar_textos_global(doc, [("C-01", calicata)] + list(config.get("text_replacements", [])), conservar, indice)
+
+    # al conservar el formato de los runs no hace falta reaplicar las fuentes
+    if not conservar:
+        with etapas.etapa("formato"):
+            aplicar_formato_documento(doc, config["font_config"])
+
+    # aplicar mapeos (una sola lectura del libro según el plan, la caché de valores o el dataset)
+    plan = recursos.plan
+    if recursos.dataset is not None:
+        valores, fallos = recursos.dataset.datos(numero, plan.encabezados)
+    elif leido is not None:
+        # la sesión Excel es del hilo de lectura: aquí no se abre ni se libera nada
+        if leido["error"] is not None:
+            raise leido["error"]
+        if leido["valores"] is None:
+            raise FileNotFoundError(f"No se encontró archivo Excel para {calicata}")
+        valores, fallos = leido["valores"], leido["fallos"]
+    else:
+        excel_path = recursos.excel.ruta(numero)
+        if not excel_path:
+            raise FileNotFoundError(f"No se encontró archivo Excel para {calicata}")
+        valores, fallos = recursos.extraer(excel_path, log=log)
+    for encabezado in plan.encabezados:
+        if encabezado in fallos:
+            log(f"  ⚠️ Error mapeo {encabezado}: {str(fallos[encabezado])}", logging.WARNING)
+            continue
+        try:
+            val = valores[encabezado]
+            with etapas.etapa("insertar_tablas"):
+                insertar_datos_en_tablas_mejorado(doc, encabezado, val, config["font_config"], indice)
+            log(f"  ✅ {encabezado} = {val}", logging.DEBUG)
+        except Exception as e:
+            log(f"  ⚠️ Error mapeo {encabezado}: {str(e)}", logging.WARNING)
+
+    # imágenes
+    if config.get("imagen_config", {}).get("usar_mapeo_automatico", False):
+        cache = recursos.cache_imagenes if leido is None else _FotosPreparadas(leido["fotos"], recursos.cache_imagenes)
+        with etapas.etapa("imagenes"):
+            procesar_imagenes_calicata(doc, calicata, numero, config, log, indice, cache, recursos.indice_imagenes)
+
+    # nombre y guardar
+    nombre = generar_nombre_archivo(config["archivo_config"], numero)
+    outpath = os.path.join(config["output_folder"], f"{nombre}.docx")
+    if escritor is not None:
+        # se bloquea si la cola de escritura está llena (memoria acotada)
+        with etapas.etapa("espera_escritura"):
+            escritor.encolar(numero, doc, outpath)
+        return outpath
+    t0 = time.perf_counter()
+    with etapas.etapa("guardado"):
+        tam = guardar_docx(doc, outpath, nivel_compresion(config))
+    segundos = time.perf_counter() - t0
+    recursos.registrar_guardado(tam, segundos)
+    log(f"  💾 {formatear_bytes(tam)}, guardado en {segundos:.2f} s", logging.DEBUG)
+    return outpath
+
+class _FotosPreparadas:
+    """Sustituto de CacheImagenes con las fotos ya leídas por LecturaAnticipada."""
+
+    def __init__(self, preparadas, cache):
+        self.preparadas = preparadas
+        self.cache = cache
+
+    def preparar(self, ruta, alto_cm):
+        datos = self.preparadas.get(ruta)
+        return io.BytesIO(datos) if datos is not None else self.cache.preparar(ruta, alto_cm)
+
+# marca de fin en la cola de LecturaAnticipada
+_FIN_LECTURA = object()
+
+class LecturaAnticipada(threading.Thread):
+    """
+    Etapa de lectura del modo pipeline: recorre las calicatas en orden leyendo sus
+    valores Excel y sus fotos (reducidas con la caché de imágenes y leídas a
+    memoria), y deja el resultado en una cola de 'anticipacion' elementos; cuando
+    está llena espera a que se consuma. Mientras dura usa en exclusiva la sesión
+    Excel y la caché de valores de los recursos. Los errores no se lanzan: viajan
+    en el elemento de la calicata, y al terminar (o fallar) el hilo encola
+    _FIN_LECTURA para que siguiente() no espere nunca en vano.
+    """
+
+    def __init__(self, recursos, numeros, anticipacion):
+        super().__init__(name="lectura-anticipada", daemon=True)
+        self.recursos = recursos
+        self.numeros = list(numeros)
+        self.cola = queue.Queue(maxsize=max(int(anticipacion), 1))
+        self._parar = threading.Event()
+        self._sin_medir = MedidorEtapas()
+
+    def run(self):
+        try:
+            for numero in self.numeros:
+                if self._parar.is_set():
+                    break
+                self._encolar(self._leer(numero))
+        finally:
+            try:
+                self.recursos.sesion.cerrar()
+            finally:
+                self._encolar(_FIN_LECTURA)
+
+    def _encolar(self, elemento):
+        while not self._parar.is_set():
+            try:
+                self.cola.put(elemento, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _leer(self, numero):
+        recursos = self.recursos
+        config = recursos.config
+        leido = {"numero": numero, "valores": None, "fallos": None, "error": None, "fotos": {}}
+        try:
+            excel_path = recursos.excel.ruta(numero) if recursos.dataset is None else None
+            if excel_path:
+                leido["valores"], leido["fallos"] = recursos.extraer(excel_path, self._sin_medir)
+            if config.get("imagen_config", {}).get("usar_mapeo_automatico", False) and config.get("imagenes_folder"):
+                imgs = recursos.indice_imagenes.imagenes(recursos.indice_imagenes.subcarpeta(numero))
+                alto = altura_imagenes(config)
+                for m in config["imagen_config"].get("imagen_mapeos", []):
+                    subidx = m.get("imagen_subcarpeta", 1) - 1
+                    if 0 <= subidx < len(imgs) and imgs[subidx] not in leido["fotos"]:
+                        try:
+                            with open(recursos.cache_imagenes.preparar(imgs[subidx], alto), "rb") as f:
+                                leido["fotos"][imgs[subidx]] = f.read()
+                        except OSError:
+                            pass  # se reintenta (y se informa) al insertarla
+        except Exception as e:
+            leido["error"] = e
+        return leido
+
+    def siguiente(self, detener=None):
+        """
+        Siguiente calicata leída, o None si la lectura terminó, se detuvo el
+        proceso ('detener') o el hilo murió sin encolar nada más.
+        """
+        while True:
+            try:
+                elemento = self.cola.get(timeout=0.2)
+            except queue.Empty:
+                if (detener is not None and detener()) or not self.is_alive():
+                    try:
+                        elemento = self.cola.get_nowait()
+                    except queue.Empty:
+                        return None
+                else:
+                    continue
+            return None if elemento is _FIN_LECTURA else elemento
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+
+class EscritorInformes:
+    """
+    Etapa de escritura de un proceso: 'hilos' hilos guardan en segundo plano
+    (con guardar_docx, atómico) los documentos terminados. encolar() se bloquea
+    si hay 'capacidad' documentos pendientes, así la memoria queda acotada.
+    Los resultados (numero, ruta, bytes, segundos, error) se recogen con
+    completados() desde el hilo principal.
+    """
+
+    def __init__(self, capacidad, hilos=1, nivel_compresion=6):
+        self.cola = queue.Queue(maxsize=max(int(capacidad), 1))
+        self.hechos = queue.Queue()
+        self.nivel_compresion = nivel_compresion
+        self._hilos = [threading.Thread(target=self._escribir, name=f"escritor-informes-{k}", daemon=True)
+                       for k in range(max(int(hilos), 1))]
+
+    def start(self):
+        for hilo in self._hilos:
+            hilo.start()
+
+    def encolar(self, numero, doc, outpath):
+        self.cola.put((numero, doc, outpath))
+
+    def _escribir(self):
+        while True:
+            item = self.cola.get()
+            if item is None:
+                break
+            numero, doc, outpath = item
+            t0 = time.perf_counter()
+            try:
+                tam = guardar_docx(doc, outpath, self.nivel_compresion)
+                self.hechos.put((numero, outpath, tam, time.perf_counter() - t0, None))
+            except Exception as e:
+                self.hechos.put((numero, outpath, 0, 0.0, e))
+
+    def completados(self):
+        hechos = []
+        while True:
+            try:
+                hechos.append(self.hechos.get_nowait())
+            except queue.Empty:
+                return hechos
+
+    def terminar(self):
+        """Espera a que se escriban los documentos pendientes."""
+        for _hilo in self._hilos:
+            self.cola.put(None)
+        for hilo in self._hilos:
+            hilo.join()
+
+# Recursos del proceso de trabajo (modo paralelo); se crean en _iniciar_proceso_trabajo.
+_RECURSOS_PROCESO = None
+# nivel mínimo de las líneas de log que el proceso de trabajo devuelve
+_NIVEL_LOG_PROCESO = logging.DEBUG
+
+def _iniciar_proceso_trabajo(config, indice_excel=None, indice_imagenes=None, nivel_minimo=None):
+    global _RECURSOS_PROCESO, _NIVEL_LOG_PROCESO
+    _RECURSOS_PROCESO = RecursosEjecucion(config, indice_excel, indice_imagenes)
+    _NIVEL_LOG_PROCESO = nivel_log(config) if nivel_minimo is None else nivel_minimo
+
+def _tarea_calicata(numero):
+    """
+    Ejecuta una calicata en un proceso de trabajo. Devuelve un dict simple
+    (serializable) con el resultado y las líneas de log producidas: (texto, nivel).
+    """
+    lineas = []
+    minimo = _NIVEL_LOG_PROCESO
+
+    def log(texto, nivel=logging.INFO):
+        if nivel >= minimo:
+            lineas.append((texto, nivel))
+
+    sesion = _RECURSOS_PROCESO.sesion
+    aperturas, reutilizaciones = sesion.aperturas, sesion.reutilizaciones
+    imagenes = dict(_RECURSOS_PROCESO.cache_imagenes.estadisticas)
+    valores = dict(_RECURSOS_PROCESO.cache_valores.estadisticas)
+    guardado = dict(_RECURSOS_PROCESO.guardado)
+    resultado = {"numero": numero, "ok": False, "salida": None, "error": None, "log": lineas}
+    _RECURSOS_PROCESO.etapas.iniciar(numero)
+    try:
+        resultado["salida"] = generar_informe_individual(_RECURSOS_PROCESO, numero, log)
+        resultado["ok"] = True
+    except Exception as e:
+        resultado["error"] = str(e)
+    resultado["etapas"] = _RECURSOS_PROCESO.etapas.terminar()
+    resultado["libros"] = (sesion.aperturas - aperturas, sesion.reutilizaciones - reutilizaciones)
+    resultado["imagenes"] = {k: v - imagenes[k] for k, v in _RECURSOS_PROCESO.cache_imagenes.estadisticas.items()}
+    resultado["valores"] = {k: v - valores[k] for k, v in _RECURSOS_PROCESO.cache_valores.estadisticas.items()}
+    resultado["guardado"] = {k: v - guardado[k] for k, v in _RECURSOS_PROCESO.guardado.items()}
+    return resultado
+
+def insertar_datos_consolidados(doc, datos_consolidados, font_config, log, indice=None):
+    """
+    Inserta valores en las tablas del doc en base a datos_consolidados:
+    datos_consolidados = { "C-01": { "EncabezadoFila": valor, ... }, ... }
+    El algoritmo intenta encontrar columnas que coincidan con los nombres de calicata.
+    Con un IndicePlantilla (construido sobre este mismo doc) los encabezados y
+    cabeceras de fila se toman del índice.
+    """
+    try:
+        for t_idx, tabla in enumerate(doc.tables):
+            if not tabla.rows:
+                continue
+            info = indice.tablas[t_idx] if indice is not None else None
+            headers = info["encabezados"] if info else [c.text.strip() for c in tabla.rows[0].cells]
+            cal_cols = {}
+            for idx, head in enumerate(headers):
+                for cal in datos_consolidados.keys():
+                    if cal in head or head in cal:
+                        cal_cols[idx] = cal
+                        break
+            filas = tabla.rows
+            for r_idx in range(1, len(filas)):
+                row = filas[r_idx]
+                if info:
+                    row_header = info["filas"][r_idx - 1]
+                else:
+                    row_header = row.cells[0].text.strip() if row.cells else ""
+                for col_idx, cal in cal_cols.items():
+                    if col_idx < len(row.cells):
+                        datos = datos_consolidados.get(cal, {})
+                        if row_header in datos:
+                            val = datos[row_header]
+                            row.cells[col_idx].text = str(val)
+                            # formato en cell
+                            for p in row.cells[col_idx].paragraphs:
+                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                                for run in p.runs:
+                                    try:
+                                        run.font.name = font_config["table_font"]
+                                        run.font.size = Pt(font_config["table_size"])
+                                    except Exception:
+                                        pass
+    except Exception as e:
+        log(f"⚠️ Error insertando datos consolidados: {str(e)}", logging.WARNING)
+
+class ManifiestoSalida:
+    """
+    Manifiesto de la carpeta de salida (.manifiesto_informes.json) para el modo
+    incremental: por calicata guarda la huella de sus entradas y el .docx generado.
+    Una calicata se regenera si cambió su huella o si su .docx ya no está como se dejó.
+    Huella = plantilla + configuración (sin las opciones de rendimiento) + Excel
+    (ruta, fecha, tamaño) o su fila del dataset en modo render + fotos de su
+    subcarpeta cuando hay mapeo de imágenes.
+    """
+
+    NOMBRE = ".manifiesto_informes.json"
+
+    def __init__(self, config, indice_excel, indice_imagenes, dataset=None):
+        self.ruta = os.path.join(config["output_folder"], self.NOMBRE)
+        self.indice_excel = indice_excel
+        self.dataset = dataset
+        self.indice_imagenes = indice_imagenes
+        self.usar_imagenes = config.get("imagen_config", {}).get("usar_mapeo_automatico", False)
+        self._base = self._huella_base(config)
+        self.informes = self._leer()
+
+    @staticmethod
+    def _huella_base(config):
+        h = hashlib.sha1()
+        with open(config["docx_path"], "rb") as f:
+            h.update(f.read())
+        # las opciones de rendimiento y de registro no cambian el contenido de los informes
+        relevante = {k: v for k, v in config.items()
+                     if k not in ("procesamiento_config", "log_config")}
+        relevante["excel_config"] = {k: v for k, v in config.get("excel_config", {}).items()
+                                     if k not in ("modo_lectura", "medir_recursos", "cache_valores", "ruta_cache")}
+        relevante["archivo_config"] = {k: v for k, v in config.get("archivo_config", {}).items() if k != "nivel_compresion"}
+        h.update(json.dumps(relevante, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def _leer(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                return json.load(f).get("informes", {})
+        except (OSError, ValueError):
+            return {}
+
+    def huella(self, numero):
+        h = hashlib.sha1(self._base.encode("ascii"))
+        excel = None if self.dataset is not None else self.indice_excel.ruta(numero)
+        if self.dataset is not None:
+            h.update(self.dataset.huella(numero).encode("utf-8"))
+        elif excel:
+            try:
+                st = os.stat(excel)
+                h.update(f"{excel}|{st.st_mtime_ns}|{st.st_size}\n".encode("utf-8"))
+            except OSError:
+                pass
+        if self.usar_imagenes:
+            for foto in self.indice_imagenes.imagenes(self.indice_imagenes.subcarpeta(numero)):
+                h.update(f"{foto}|{self.indice_imagenes.firma(foto)}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def vigente(self, numero, huella):
+        """True si el informe de 'numero' ya existe y se generó con estas mismas entradas."""
+        info = self.informes.get(f"C-{numero:02d}")
+        if not info or info.get("huella") != huella:
+            return False
+        try:
+            st = os.stat(info["salida"])
+        except (OSError, KeyError):
+            return False
+        return st.st_size == info.get("tam") and st.st_mtime_ns == info.get("mtime_ns")
+
+    def registrar(self, numero, salida, huella):
+        st = os.stat(salida)
+        self.informes[f"C-{numero:02d}"] = {"huella": huella, "salida": salida, "tam": st.st_size, "mtime_ns": st.st_mtime_ns}
+        self.guardar()
+
+    def guardar(self):
+        tmp = self.ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "informes": self.informes}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.ruta)
+
+class DiarioEjecucion:
+    """
+    Diario de la ejecución individual (.diario_informes.jsonl en la carpeta de
+    salida): una línea JSON por calicata terminada, escrita en el momento, para
+    poder reanudar una ejecución detenida o interrumpida.
+    Una ejecución nueva empieza el diario; una reanudación añade al existente.
+    Usar como context manager.
+    """
+
+    NOMBRE = ".diario_informes.jsonl"
+
+    def __init__(self, carpeta, start_val, end_val, reanudar=False):
+        self.ruta = os.path.join(carpeta, self.NOMBRE)
+        cortada = reanudar and self._termina_a_medias()
+        self._f = open(self.ruta, "a" if reanudar else "w", encoding="utf-8")
+        if cortada:
+            self._f.write("\n")
+        self._escribir({"evento": "reanudacion" if reanudar else "inicio", "rango": [start_val, end_val]})
+
+    def _termina_a_medias(self):
+        try:
+            with open(self.ruta, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    @classmethod
+    def completadas(cls, carpeta):
+        """{numero: salida} de las calicatas generadas sin error según el diario."""
+        hechas = {}
+        try:
+            with open(os.path.join(carpeta, cls.NOMBRE), "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        continue  # línea a medias si la ejecución se cortó al escribirla
+                    if entrada.get("evento") == "inicio":
+                        hechas = {}
+                    elif entrada.get("evento") == "calicata":
+                        if entrada.get("estado") == "ok":
+                            hechas[entrada["numero"]] = entrada.get("salida")
+                        else:
+                            hechas.pop(entrada["numero"], None)
+        except OSError:
+            pass
+        return hechas
+
+    def registrar(self, numero, salida=None, error=None):
+        self._escribir({"evento": "calicata", "numero": numero, "calicata": f"C-{numero:02d}",
+                        "estado": "ok" if error is None else "error", "salida": salida, "error": error})
+
+    def finalizar(self, procesados, errores, detenido):
+        self._escribir({"evento": "fin", "procesados": procesados, "errores": errores, "detenido": detenido})
+
+    def _escribir(self, entrada):
+        entrada["fecha"] = datetime.now().isoformat(timespec="seconds")
+        self._f.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def cerrar(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cerrar()
+        return False
+
+class CanalEventos:
+    """
+    Canal entre el hilo de trabajo y la GUI: el hilo solo encola eventos (nunca
+    toca widgets ni espera a que se dibujen) y el hilo de Tk los drena por lotes
+    con root.after. Eventos (tuplas):
+      ("log", linea) / ("progreso", valor, maximo, texto) / ("estado", texto, color) / ("fin", error)
+    """
+
+    def __init__(self):
+        self._cola = queue.Queue()
+
+    def log(self, linea):
+        self._cola.put(("log", linea))
+
+    def progreso(self, valor=None, maximo=None, texto=None):
+        self._cola.put(("progreso", valor, maximo, texto))
+
+    def estado(self, texto, color=None):
+        self._cola.put(("estado", texto, color))
+
+    def fin(self, error=None):
+        self._cola.put(("fin", error))
 
-    # Insertar nueva imagen
-    try:
-        if fixed_height_cm:
-            run.add_picture(ruta_imagen, height=Cm(float(fixed_height_cm)))
-        else:
-            run.add_picture(ruta_imagen)
-    except Exception as e:
-        # fallback: intentar sin height
+    def drenar(self, maximo=2000):
+        """Saca hasta 'maximo' eventos pendientes sin bloquear."""
+        eventos = []
         try:
-            run.add_picture(ruta_imagen)
-        except Exception as e2:
-            raise Exception(f"No se pudo insertar la imagen {ruta_imagen}: {str(e2)}")
+            while len(eventos) < maximo:
+                eventos.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+        return eventos
 
-def extraer_dato_excel_mejorado(excel_path, hoja, celda, tipo, decimales_config):
+class ProcesadorInformes:
     """
-    Extrae un valor o calcula promedio según 'tipo' desde excel_path.
-    - celda soporta: "A1", "A1:A10", "C5,E7,F9", "C5:E10".
-    - tipo: "valor" (devuelve primera celda válida), "promedio" (media numérica).
+    Ejecuta los flujos individual y consolidado a partir de un dict de
+    configuración (el mismo que escribe guardar_config_json), sin depender de Tk.
+    La GUI y la línea de comandos le pasan sus callbacks:
+      - log(texto)  (solo recibe los mensajes del nivel configurado en log_config)
+      - o bien log_con_nivel(texto, nivel), que recibe todos los mensajes con su
+        nivel y filtra él mismo (la GUI: todo al archivo, el nivel a la ventana)
+      - progreso(valor=None, maximo=None, texto=None)
+      - estado(texto, color=None)
+      - detener() -> True si el usuario pidió parar
     """
-    wb = load_workbook(excel_path, data_only=True)
-    if hoja not in wb.sheetnames:
-        raise ValueError(f"No se encontró la hoja '{hoja}' en {os.path.basename(excel_path)}")
 
-    ws = wb[hoja]
+    def __init__(self, config, log=None, progreso=None, estado=None, detener=None, log_con_nivel=None):
+        self.config = config
+        self._log = log or print
+        self._log_con_nivel = log_con_nivel
+        self.nivel_log = logging.DEBUG if log_con_nivel is not None else nivel_log(config)
+        self.progreso = progreso or (lambda valor=None, maximo=None, texto=None: None)
+        self.estado = estado or (lambda texto, color=None: None)
+        self.detener = detener or (lambda: False)
+
+    def log(self, texto, nivel=logging.INFO):
+        if self._log_con_nivel is not None:
+            self._log_con_nivel(texto, nivel)
+        elif nivel >= self.nivel_log:
+            self._log(texto)
+
+    def ejecutar(self, tipo, start_val, end_val, reanudar=False, dataset=None):
+        """
+        Punto de entrada común de la GUI y la línea de comandos: lanza el flujo
+        'individual', 'consolidado' o 'extraccion' (dataset = CSV de salida) y,
+        con procesamiento_config.perfilar, lo ejecuta bajo cProfile.
+        """
+        if tipo == "individual":
+            flujo = lambda: self.procesar_individuales(start_val, end_val, reanudar)
+        elif tipo == "extraccion":
+            flujo = lambda: self.extraer_dataset(start_val, end_val, dataset)
+        else:
+            flujo = lambda: self.procesar_consolidado(start_val, end_val)
+        if not self.config.get("procesamiento_config", {}).get("perfilar", False):
+            return flujo()
+        return self._perfilar(flujo)
+
+    def _perfilar(self, flujo, top=25):
+        """Guarda perfil_<fecha>.prof en la carpeta de salida y resume en el log el top por tiempo acumulado."""
+        if int(self.config.get("procesamiento_config", {}).get("procesos", 1) or 1) > 1:
+            self.log("⚠️ Perfil con procesos paralelos: solo se mide el proceso principal.", logging.WARNING)
+        perfil = cProfile.Profile()
+        perfil.enable()
+        try:
+            return flujo()
+        finally:
+            perfil.disable()
+            try:
+                ruta = os.path.join(self.config["output_folder"], f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+                perfil.dump_stats(ruta)
+                texto = io.StringIO()
+                pstats.Stats(perfil, stream=texto).strip_dirs().sort_stats("cumulative").print_stats(top)
+                self.log(f"🔬 Perfil guardado: {ruta} (top {top} por tiempo acumulado):")
+                for linea in texto.getvalue().splitlines():
+                    if linea.strip():
+                        self.log(linea)
+            except Exception as e:
+                self.log(f"⚠️ No se pudo guardar el perfil: {str(e)}", logging.WARNING)
+
+    def procesar_individuales(self, start_val, end_val, reanudar=False):
+        """
+        Genera un docx por calicata. Devuelve dict con procesados/errores/omitidos/detenido.
+        Con reanudar=True se saltan las calicatas ya completadas según el diario de la
+        ejecución anterior (DiarioEjecucion) y se continúa con las pendientes.
+        """
+        processed = 0
+        errors = 0
+        self.log(f"🚀 Iniciando procesamiento individual: {start_val}..{end_val}")
 
-    def cell_value_safe(coord):
         try:
-            v = ws[coord].value
-            return v
-        except Exception:
-            return None
+            dataset = self._cargar_dataset(start_val, end_val)
+        except Exception as e:
+            self.log(f"❌ No se pudo leer el dataset: {str(e)}", logging.ERROR)
+            self.estado("Error", "#e74c3c")
+            return {"procesados": 0, "errores": 1, "omitidos": 0, "detenido": False}
+        indice_excel = self._indexar_excel(start_val, end_val) if dataset is None else IndiceExcel([])
+        indice_imagenes = IndiceImagenes.desde_config(self.config)
+        if self.config.get("imagen_config", {}).get("usar_mapeo_automatico", False):
+            t0 = time.perf_counter()
+            indice_imagenes.precargar(start_val, end_val)
+            self.log(f"🔎 Imágenes indexadas: {indice_imagenes.resumen()} ({time.perf_counter() - t0:.2f} s)")
+
+        numeros = list(range(start_val, end_val + 1))
+        completadas = 0
+        if reanudar:
+            hechas = DiarioEjecucion.completadas(self.config["output_folder"])
+            numeros = [i for i in numeros if not (i in hechas and os.path.exists(hechas[i]))]
+            completadas = end_val - start_val + 1 - len(numeros)
+            if numeros:
+                self.log(f"↩️ Reanudando: {completadas} calicatas ya completadas, se continúa en C-{numeros[0]:02d}.")
+            else:
+                self.log(f"↩️ Reanudando: las {completadas} calicatas del rango ya estaban completadas.")
+
+        # modo incremental: solo las calicatas cuyas entradas cambiaron
+        omitidos = 0
+        manifiesto = None
+        huellas = {}
+        if self.config.get("procesamiento_config", {}).get("incremental", False):
+            manifiesto = ManifiestoSalida(self.config, indice_excel, indice_imagenes, dataset)
+            huellas = {i: manifiesto.huella(i) for i in numeros}
+            pendientes = [i for i in numeros if not manifiesto.vigente(i, huellas[i])]
+            omitidos = len(numeros) - len(pendientes)
+            numeros = pendientes
+            self.log(f"⏭️ Modo incremental: {omitidos} sin cambios, {len(numeros)} por generar.")
+        total = len(numeros)
+        self.progreso(maximo=total)
+        etapas = MedidorEtapas(self.config.get("procesamiento_config", {}).get("medir_etapas", False))
+
+        with DiarioEjecucion(self.config["output_folder"], start_val, end_val, reanudar) as diario:
+            procesos = int(self.config.get("procesamiento_config", {}).get("procesos", 1) or 1)
+            if procesos > 1 and total > 1:
+                processed, errors = self._procesar_individuales_paralelo(numeros, procesos, indice_excel, indice_imagenes, manifiesto, huellas, diario, etapas)
+            else:
+                with RecursosEjecucion(self.config, indice_excel, indice_imagenes, dataset) as recursos:
+                    pc = self.config.get("procesamiento_config", {})
+                    hilos = int(pc.get("hilos_escritura", 2) or 0)
+                    pipeline = pc.get("pipeline", False)
+                    if (pipeline or hilos) and total > 1:
+                        anticipacion = int(pc.get("anticipacion", 3) or 3)
+                        processed, errors = self._procesar_individuales_pipeline(
+                            recursos, numeros, anticipacion, max(hilos, 1), pipeline, manifiesto, huellas, diario, etapas)
+                        numeros = []
+                    for n, i in enumerate(numeros, 1):
+                        if self.detener():
+                            self.log("⏹️ Procesamiento detenido por el usuario.")
+                            break
+                        calicata = f"C-{i:02d}"
+                        self.progreso(texto=f"Procesando {calicata} ({n}/{total})")
+                        recursos.etapas.iniciar(i)
+                        try:
+                            outpath = generar_informe_individual(recursos, i, self.log)
+                            processed += 1
+                            self.log(f"✅ {calicata} -> {os.path.basename(outpath)}")
+                            diario.registrar(i, outpath)
+                            if manifiesto is not None:
+                                manifiesto.registrar(i, outpath, huellas[i])
+                        except Exception as e:
+                            errors += 1
+                            self.log(f"❌ Error con {calicata}: {str(e)}", logging.ERROR)
+                            diario.registrar(i, error=str(e))
+                        finally:
+                            etapas.agregar(i, recursos.etapas.terminar())
+                            self.progreso(valor=processed + errors)
+                    self.log(f"📊 Libros Excel: {recursos.sesion.resumen()}")
+                    self._log_resumen_valores(recursos.cache_valores.estadisticas)
+                    self._log_resumen_salida(recursos.cache_imagenes.estadisticas, recursos.guardado)
+            diario.finalizar(processed, errors, self.detener())
+        if etapas.activo and etapas.calicatas:
+            self._informar_etapas(etapas)
 
-    if tipo == "valor":
-        # una celda simple
-        if ":" not in celda and "," not in celda:
-            v = cell_value_safe(celda)
-            result = v if v is not None else ""
+        # resumen
+        detenido = self.detener()
+        if not detenido:
+            if errors == 0:
+                sin_cambios = f" ({omitidos} sin cambios)" if omitidos else ""
+                if completadas:
+                    sin_cambios += f" ({completadas} ya completadas)"
+                self.log(f"🎉 Procesamiento completado: {processed} archivos generados{sin_cambios}.")
+                self.estado("Completado", "#27ae60")
+            else:
+                self.log(f"⚠️ Procesamiento finalizó con {errors} errores. {processed} exitosos.", logging.WARNING)
+                self.estado("Completado con errores", "#f39c12")
         else:
-            # lista de celdas separadas por comas: devolver la primera no-vacía
-            parts = [c.strip() for c in celda.split(",")]
-            result = ""
-            for p in parts:
-                if ":" in p:
-                    # rango -> tomar primer valor no-nulo del rango
-                    try:
-                        rng = ws[p]
-                        for row in rng:
-                            # row puede ser tuple
-                            if isinstance(row, tuple):
-                                for cell in row:
-                                    if cell.value is not None:
-                                        result = cell.value
-                                        break
-                                if result != "":
-                                    break
-                            else:
-                                if row.value is not None:
-                                    result = row.value
-                                    break
-                    except Exception:
+            self.estado("Detenido", "#e74c3c")
+        return {"procesados": processed, "errores": errors, "omitidos": omitidos + completadas, "detenido": detenido}
+
+    def _cargar_dataset(self, start_val, end_val):
+        """Modo render: lee el dataset de procesamiento_config.dataset (None si no hay) y avisa de las calicatas que faltan."""
+        dataset = DatasetCalicatas.desde_config(self.config)
+        if dataset is not None:
+            self.log(f"🗂️ Datos desde dataset: {self.config['procesamiento_config']['dataset']} ({dataset.resumen()})")
+            faltantes = [f"C-{i:02d}" for i in range(start_val, end_val + 1) if i not in dataset.filas]
+            if faltantes:
+                self.log(f"⚠️ Sin datos en el dataset ({len(faltantes)}): {', '.join(faltantes)}", logging.WARNING)
+            ausentes = [enc for enc in PlanExtraccion(self.config.get("mappings", [])).encabezados if enc not in dataset.encabezados]
+            if ausentes:
+                self.log(f"⚠️ Encabezados sin columna en el dataset: {', '.join(ausentes)}", logging.WARNING)
+        return dataset
+
+    def extraer_dataset(self, start_val, end_val, ruta=None):
+        """
+        Etapa "extract": lee los mapeos de cada calicata del rango una sola vez y los
+        escribe en un DatasetCalicatas (CSV, por defecto datos_calicatas.csv en la
+        carpeta de salida). Devuelve dict con procesados/errores/detenido/ruta.
+        """
+        ruta = ruta or DatasetCalicatas.ruta_por_defecto(self.config)
+        total = end_val - start_val + 1
+        processed = 0
+        errors = 0
+        self.progreso(valor=0, maximo=total)
+        self.log(f"🚀 Extrayendo datos: {start_val}..{end_val}")
+        # la extracción siempre lee los Excel, aunque la configuración apunte a un dataset
+        config = dict(self.config, procesamiento_config=dict(self.config.get("procesamiento_config", {}), dataset=""))
+        with RecursosEjecucion(config, self._indexar_excel(start_val, end_val)) as recursos:
+            dataset = DatasetCalicatas(recursos.plan.encabezados)
+            for n, i in enumerate(range(start_val, end_val + 1), 1):
+                if self.detener():
+                    self.log("⏹️ Procesamiento detenido por el usuario.")
+                    break
+                calicata = f"C-{i:02d}"
+                excel_path = recursos.excel.ruta(i)
+                self.progreso(texto=f"Extrayendo {calicata} ({n}/{total})")
+                try:
+                    if not excel_path:
+                        errors += 1
+                        dataset.agregar(i)
                         continue
+                    valores, fallos = recursos.extraer(excel_path, log=self.log)
+                    dataset.agregar(i, excel_path, valores, fallos)
+                    processed += 1
+                    for encabezado, e in fallos.items():
+                        self.log(f"  ⚠️ {calicata} {encabezado}: {str(e)}", logging.WARNING)
+                    self.log(f"✅ {calicata}: {len(valores)} valores", logging.DEBUG)
+                except Exception as e:
+                    errors += 1
+                    dataset.agregar(i, excel_path, error=str(e))
+                    self.log(f"❌ Error con {calicata}: {str(e)}", logging.ERROR)
+                finally:
+                    self.progreso(valor=n)
+            self.log(f"📊 Libros Excel: {recursos.sesion.resumen()}")
+            self._log_resumen_valores(recursos.cache_valores.estadisticas)
+        detenido = self.detener()
+        try:
+            dataset.escribir(ruta)
+        except Exception as e:
+            self.log(f"❌ No se pudo guardar el dataset: {str(e)}", logging.ERROR)
+            self.estado("Error", "#e74c3c")
+            return {"procesados": processed, "errores": errors + 1, "detenido": detenido, "ruta": None}
+        self.log(f"🗂️ Dataset guardado: {ruta} ({dataset.resumen()}, {errors} sin datos)")
+        if not detenido:
+            self.estado("Completado" if errors == 0 else "Completado con errores", "#27ae60" if errors == 0 else "#f39c12")
+        else:
+            self.estado("Detenido", "#e74c3c")
+        return {"procesados": processed, "errores": errors, "detenido": detenido, "ruta": ruta}
+
+    def _indexar_excel(self, start_val, end_val):
+        """Indexa las carpetas de Excel e informa antes de empezar de los que faltan o están repetidos."""
+        indice = IndiceExcel.desde_config(self.config)
+        self.log(f"🔎 Excel indexados: {indice.resumen()}")
+        faltantes, duplicados = indice.revisar(start_val, end_val)
+        if faltantes:
+            self.log(f"⚠️ Sin Excel ({len(faltantes)}): {', '.join(faltantes)}", logging.WARNING)
+        for calicata, rutas in duplicados.items():
+            self.log(f"⚠️ {calicata} tiene {len(rutas)} Excel, se usará el primero: {' | '.join(rutas)}", logging.WARNING)
+        return indice
+
+    def _informar_etapas(self, etapas):
+        calicatas = sum(1 for n in etapas.calicatas if n != MedidorEtapas.DOCUMENTO)
+        self.log(f"⏱️ Tiempo por etapa ({calicatas} calicatas):")
+        for linea in etapas.lineas_resumen():
+            self.log(linea)
+        try:
+            procesos = int(self.config.get("procesamiento_config", {}).get("procesos", 1) or 1)
+            rutas = etapas.exportar(self.config["output_folder"], {"procesos": procesos})
+            self.log(f"📁 Rendimiento exportado: {', '.join(os.path.basename(r) for r in rutas)}")
+        except Exception as e:
+            self.log(f"⚠️ No se pudo exportar el rendimiento: {str(e)}", logging.WARNING)
+
+    def _procesar_individuales_paralelo(self, numeros, procesos, indice_excel=None, indice_imagenes=None, manifiesto=None, huellas=None, diario=None, etapas=None):
+        """
+        Genera las calicatas en un pool de procesos. Los resultados (y sus líneas
+        de log) se reciben a medida que cada calicata termina. Devuelve (processed, errors).
+        El diario y el manifiesto (modo incremental) se escriben desde el proceso principal.
+        """
+        total = len(numeros)
+        processed = 0
+        errors = 0
+        aperturas = 0
+        reutilizaciones = 0
+        imagenes = {}
+        valores = {}
+        guardado = {}
+        self.log(f"⚙️ Modo paralelo: {procesos} procesos.")
+        # 'spawn' evita heredar el estado de Tk en los procesos hijos
+        ctx = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=procesos, mp_context=ctx, initializer=_iniciar_proceso_trabajo,
+                                       initargs=(self.config, indice_excel, indice_imagenes, self.nivel_log))
+        try:
+            futuros = [executor.submit(_tarea_calicata, i) for i in numeros]
+            for fut in as_completed(futuros):
+                try:
+                    res = fut.result()
+                except Exception as e:
+                    errors += 1
+                    self.log(f"❌ Error en proceso de trabajo: {str(e)}", logging.ERROR)
                 else:
-                    val = cell_value_safe(p)
-                    if val is not None:
-                        result = val
-                        break
-        # aplicar decimales si numérico
-        if isinstance(result, (int, float)) and decimales_config.get("usar_decimales_fijos", False):
-            dec = int(decimales_config.get("cantidad_decimales", 1))
-            result = round(result, dec)
-        return result
-
-    elif tipo == "promedio":
-        valores = []
-        # si es rango con ':'
-        if ":" in celda:
-            try:
-                rng = ws[celda]
-                # rng puede ser generator de tuples
-                for row in rng:
-                    if isinstance(row, tuple):
-                        for cell in row:
-                            if isinstance(cell.value, (int, float)):
-                                valores.append(cell.value)
+                    calicata = f"C-{res['numero']:02d}"
+                    for linea, nivel in res["log"]:
+                        self.log(linea, nivel)
+                    if etapas is not None:
+                        etapas.agregar(res["numero"], res["etapas"])
+                    aperturas += res["libros"][0]
+                    reutilizaciones += res["libros"][1]
+                    for acumulado, parcial in ((imagenes, res["imagenes"]), (valores, res["valores"]), (guardado, res["guardado"])):
+                        for k, v in parcial.items():
+                            acumulado[k] = acumulado.get(k, 0) + v
+                    if res["ok"]:
+                        processed += 1
+                        self.log(f"✅ {calicata} -> {os.path.basename(res['salida'])}")
+                        if diario is not None:
+                            diario.registrar(res["numero"], res["salida"])
+                        if manifiesto is not None:
+                            manifiesto.registrar(res["numero"], res["salida"], huellas[res["numero"]])
                     else:
-                        if isinstance(row.value, (int, float)):
-                            valores.append(row.value)
-            except Exception as e:
-                raise ValueError(f"Error procesando rango {celda}: {str(e)}")
-        elif "," in celda:
-            parts = [c.strip() for c in celda.split(",")]
-            for p in parts:
-                try:
-                    v = ws[p].value
-                    if isinstance(v, (int, float)):
-                        valores.append(v)
-                except Exception:
-                    continue
+                        errors += 1
+                        self.log(f"❌ Error con {calicata}: {res['error']}", logging.ERROR)
+                        if diario is not None:
+                            diario.registrar(res["numero"], error=res["error"])
+                    self.progreso(texto=f"Completado {calicata} ({processed + errors}/{total})")
+                self.progreso(valor=processed + errors)
+                if self.detener():
+                    for f in futuros:
+                        f.cancel()
+                    self.log("⏹️ Procesamiento detenido por el usuario.")
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.log(f"📊 Libros Excel: {aperturas} aperturas, {reutilizaciones} reutilizaciones")
+        if valores:
+            self._log_resumen_valores(valores)
+        if guardado:
+            self._log_resumen_salida(imagenes, guardado)
+        return processed, errors
+
+    def _procesar_individuales_pipeline(self, recursos, numeros, anticipacion, hilos, lectura=True, manifiesto=None, huellas=None, diario=None, etapas=None):
+        """
+        Un proceso con escritura en segundo plano: EscritorInformes guarda con
+        'hilos' hilos los .docx terminados mientras este hilo compone el siguiente.
+        Con 'lectura' (modo pipeline) además LecturaAnticipada lee los Excel y las
+        fotos de las próximas calicatas; ambas colas admiten 'anticipacion'
+        calicatas. Una calicata cuenta como procesada (diario, manifiesto, log)
+        cuando su archivo ya está escrito. Devuelve (processed, errors).
+        """
+        total = len(numeros)
+        processed = 0
+        errors = 0
+        if lectura:
+            self.log(f"⚙️ Modo pipeline: lectura anticipada y escritura en segundo plano ({anticipacion} calicatas en cola, {hilos} hilos de escritura).")
+            lector = LecturaAnticipada(recursos, numeros, anticipacion)
+            lector.start()
         else:
-            # única celda
-            v = ws[celda].value
-            if isinstance(v, (int, float)):
-                valores.append(v)
+            self.log(f"⚙️ Escritura en segundo plano ({hilos} hilos).", logging.DEBUG)
+            lector = None
+        escritor = EscritorInformes(anticipacion, hilos, nivel_compresion(self.config))
+        escritor.start()
+
+        def registrar_escritos():
+            nonlocal processed, errors
+            for numero, outpath, tam, segundos, error in escritor.completados():
+                calicata = f"C-{numero:02d}"
+                if error is None:
+                    processed += 1
+                    recursos.registrar_guardado(tam, segundos)
+                    if etapas is not None:
+                        etapas.sumar(numero, "guardado", segundos)
+                    self.log(f"  💾 {calicata}: {formatear_bytes(tam)}, guardado en {segundos:.2f} s", logging.DEBUG)
+                    self.log(f"✅ {calicata} -> {os.path.basename(outpath)}")
+                    if diario is not None:
+                        diario.registrar(numero, outpath)
+                    if manifiesto is not None:
+                        manifiesto.registrar(numero, outpath, huellas[numero])
+                else:
+                    errors += 1
+                    self.log(f"❌ Error guardando {calicata}: {str(error)}", logging.ERROR)
+                    if diario is not None:
+                        diario.registrar(numero, error=str(error))
+                self.progreso(valor=processed + errors)
 
-        if not valores:
-            promedio = 0
-        else:
-            promedio = sum(valores) / len(valores)
-            if decimales_config.get("usar_decimales_fijos", False):
-                dec = int(decimales_config.get("cantidad_decimales", 1))
-                promedio = round(promedio, dec)
-        return promedio
-    else:
-        raise ValueError(f"Tipo inválido: {tipo}")
+        try:
+            for n, i in enumerate(numeros, 1):
+                if self.detener():
+                    self.log("⏹️ Procesamiento detenido por el usuario.")
+                    break
+                calicata = f"C-{i:02d}"
+                self.progreso(texto=f"Procesando {calicata} ({n}/{total})")
+                recursos.etapas.iniciar(i)
+                try:
+                    leido = None
+                    if lector is not None:
+                        with recursos.etapas.etapa("espera_lectura"):
+                            leido = lector.siguiente(self.detener)
+                        if leido is None:
+                            if self.detener():
+                                self.log("⏹️ Procesamiento detenido por el usuario.")
+                                break
+                            raise RuntimeError("la lectura anticipada terminó antes de leer la calicata")
+                    generar_informe_individual(recursos, i, self.log, leido, escritor)
+                except Exception as e:
+                    errors += 1
+                    self.log(f"❌ Error con {calicata}: {str(e)}", logging.ERROR)
+                    if diario is not None:
+                        diario.registrar(i, error=str(e))
+                    self.progreso(valor=processed + errors)
+                finally:
+                    tiempos = recursos.etapas.terminar()
+                    if etapas is not None:
+                        etapas.agregar(i, tiempos)
+                registrar_escritos()
+        finally:
+            if lector is not None:
+                lector.parar()
+            escritor.terminar()
+            registrar_escritos()
+        return processed, errors
+
+    def _log_resumen_valores(self, valores):
+        # en modo render no se consulta la caché (los valores vienen del dataset)
+        if self.config.get("excel_config", {}).get("cache_valores", True) and not self.config.get("procesamiento_config", {}).get("dataset"):
+            self.log(f"📊 Caché de valores: {CacheValores.formatear_resumen(valores)}")
+
+    def _log_resumen_salida(self, imagenes, guardado):
+        if self.config.get("imagen_config", {}).get("usar_mapeo_automatico", False):
+            self.log(f"📊 Imágenes: {CacheImagenes.formatear_resumen(imagenes)}")
+        self.log(f"📊 Salida: {RecursosEjecucion.formatear_guardado(guardado)}")
+
+    def procesar_consolidado(self, start_val, end_val):
+        """Genera un único docx con todas las calicatas. Devuelve dict con procesados/errores/detenido."""
+        total = end_val - start_val + 1
+        self.progreso(valor=0, maximo=total)
+        self.log(f"🚀 Iniciando informe consolidado: {start_val}..{end_val}")
+
+        # abrir doc base
+        try:
+            dataset = self._cargar_dataset(start_val, end_val)
+            indice_excel = self._indexar_excel(start_val, end_val) if dataset is None else IndiceExcel([])
+            with RecursosEjecucion(self.config, indice_excel, dataset=dataset) as recursos:
+                etapas = recursos.etapas
+                etapas.iniciar(MedidorEtapas.DOCUMENTO)
+                with etapas.etapa("plantilla"):
+                    doc = recursos.plantilla.nuevo_documento()
+                conservar = self.config.get("reemplazo_config", {}).get("conservar_formato", False)
+                if not conservar:
+                    with etapas.etapa("formato"):
+                        aplicar_formato_documento(doc, self.config["font_config"])
+                with etapas.etapa("reemplazos"):
+                    reemplazar_textos_global(doc, self.config.get("text_replacements", []), conservar)
+                etapas.terminar()
+
+                datos_consolidados = {}
+                plan = recursos.plan
+                sesion = recursos.sesion
+                for i in range(start_val, end_val + 1):
+                    if self.detener():
+                        self.log("⏹️ Procesamiento detenido por el usuario.")
+                        return {"procesados": 0, "errores": 0, "detenido": True}
+                    calicata = f"C-{i:02d}"
+                    excel_path = None
+                    self.progreso(texto=f"Recopilando {calicata} ({i-start_val+1}/{total})")
+                    etapas.iniciar(i)
+                    try:
+                        if dataset is None:
+                            excel_path = recursos.excel.ruta(i)
+                        if not (excel_path if dataset is None else dataset.tiene_excel(i)):
+                            self.log(f"⚠️ No encontrado Excel para {calicata}", logging.WARNING)
+                            datos_consolidados[calicata] = {}
+                            continue
+                        if dataset is not None:
+                            valores, _fallos = dataset.datos(i, plan.encabezados)
+                        else:
+                            valores, _fallos = recursos.extraer(excel_path, log=self.log)
+                        datos_consolidados[calicata] = {enc: valores.get(enc, "") for enc in plan.encabezados}
+                    except Exception as e:
+                        self.log(f"⚠️ Error recopilando {calicata}: {str(e)}", logging.WARNING)
+                        datos_consolidados[calicata] = {}
+                    finally:
+                        etapas.terminar()
+                    self.progreso(valor=i - start_val + 1)
+                self.log(f"📊 Libros Excel: {sesion.resumen()}")
+                self._log_resumen_valores(recursos.cache_valores.estadisticas)
+
+            etapas.iniciar(MedidorEtapas.DOCUMENTO)
+            # insertar en tablas:
+            with etapas.etapa("insertar_tablas"):
+                indice = IndicePlantilla(doc)
+                insertar_datos_consolidados(doc, datos_consolidados, self.config["font_config"], self.log, indice)
+            # imágenes (toma la primera calicata como ejemplo)
+            if self.config.get("imagen_config", {}).get("usar_mapeo_automatico", False):
+                with etapas.etapa("imagenes"):
+                    procesar_imagenes_calicata(doc, f"C-{start_val:02d}", start_val, self.config, self.log, indice,
+                                               recursos.cache_imagenes, recursos.indice_imagenes)
+            # guardar
+            nombre = self.config["informe_config"].get("consolidado_nombre") or "Informe_Consolidado"
+            outpath = os.path.join(self.config["output_folder"], f"{nombre}.docx")
+            with etapas.etapa("guardado"):
+                guardar_docx(doc, outpath, nivel_compresion(self.config))
+            etapas.terminar()
+            self.log(f"🎉 Informe consolidado guardado: {os.path.basename(outpath)}")
+            if etapas.activo:
+                self._informar_etapas(etapas)
+            self.estado("Completado", "#27ae60")
+            return {"procesados": 1, "errores": 0, "detenido": False}
+        except Exception as e:
+            self.log(f"❌ Error generando consolidado: {str(e)}", logging.ERROR)
+            self.estado("Error", "#e74c3c")
+            return {"procesados": 0, "errores": 1, "detenido": False}
 
 # ---------------------------
 # Clase principal de la app
@@ -286,51 +2706,24 @@ class CalicataApp:
             pass
 
         # Configuración por defecto
-        self.config = {
-            "docx_path": "",
-            "excel_folder_1": "",
-            "excel_folder_2": "",
-            "output_folder": "",
-            "mappings": [],  # {"encabezado","hoja","celda","tipo"}
-            "text_replacements": [],  # list of tuples
-            "imagenes_folder": "",
-            "image_replacements": [],
-            "fixed_image_height": 5.0,
-            "font_config": {
-                "paragraph_font": "Calibri",
-                "paragraph_size": 11,
-                "table_font": "Calibri",
-                "table_size": 11
-            },
-            "archivo_config": {
-                "nombre_base": "EMS CUSCO C-",
-                "usar_sufijo": True,
-                "sufijo_personalizado": ""
-            },
-            "imagen_config": {
-                "usar_mapeo_automatico": False,
-                "imagen_mapeos": []
-            },
-            "informe_config": {
-                "tipo_informe": "individual",
-                "consolidado_nombre": "Informe_Consolidado"
-            },
-            "decimales_config": {
-                "usar_decimales_fijos": True,
-                "cantidad_decimales": 1
-            }
-        }
+        self.config = config_por_defecto()
 
         # Estado
         self.processing = False
         self.stop_processing_flag = False
         self.editing_item = None
         self.last_config_file = None
+        # log, progreso y estado pasan por aquí (pueden llegar desde el hilo de trabajo)
+        self.canal = CanalEventos()
+        # log completo en disco; la ventana solo muestra las últimas líneas
+        self.log_archivo, self.log_handler = crear_log_archivo(ruta_log_por_defecto())
+        self._marcar_sesion_log()
 
         # Construir GUI
         self.build_gui()
         self.center_window()
         self.log("🎉 Aplicación iniciada (versión corregida).")
+        self.root.after(self.INTERVALO_EVENTOS_MS, self.drenar_eventos)
 
     def center_window(self):
         self.root.update_idletasks()
@@ -491,6 +2884,47 @@ class CalicataApp:
         self.table_size = ttk.Spinbox(fmt_frame, from_=8, to=24, width=5)
         self.table_size.set("11")
         self.table_size.grid(row=1, column=3, sticky="w")
+        self.conservar_formato_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(fmt_frame, text="Conservar formato de la plantilla (reemplazar solo los runs afectados, sin reaplicar fuentes)", variable=self.conservar_formato_var).grid(row=2, column=0, columnspan=4, sticky="w", pady=4)
+
+        row += 1
+        ttk.Separator(inner, orient="horizontal").grid(row=row, column=0, columnspan=3, sticky="ew", pady=8)
+        row += 1
+
+        # Rendimiento
+        rend_frame = ttk.LabelFrame(inner, text="Rendimiento", padding=6)
+        rend_frame.grid(row=row, column=0, columnspan=3, sticky="ew", pady=6)
+        ttk.Label(rend_frame, text="Lectura Excel:").grid(row=0, column=0, sticky="w")
+        self.modo_lectura_combo = ttk.Combobox(rend_frame, values=["completo", "streaming"], width=12, state="readonly")
+        self.modo_lectura_combo.grid(row=0, column=1, sticky="w")
+        self.modo_lectura_combo.set("completo")
+        self.medir_excel_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Medir tiempo y memoria por libro", variable=self.medir_excel_var).grid(row=0, column=2, sticky="w", padx=6)
+        ttk.Label(rend_frame, text="Procesos paralelos:").grid(row=1, column=0, sticky="w")
+        self.procesos_spin = ttk.Spinbox(rend_frame, from_=1, to=max(os.cpu_count() or 1, 1), width=5)
+        self.procesos_spin.set("1")
+        self.procesos_spin.grid(row=1, column=1, sticky="w")
+        self.incremental_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Incremental (solo calicatas con cambios)", variable=self.incremental_var).grid(row=1, column=2, sticky="w", padx=6)
+        self.medir_etapas_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Medir etapas (JSON/CSV en la salida)", variable=self.medir_etapas_var).grid(row=1, column=3, sticky="w", padx=6)
+        self.perfilar_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Perfilar (cProfile, .prof en la salida)", variable=self.perfilar_var).grid(row=0, column=3, sticky="w", padx=6)
+        self.pipeline_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Pipeline (leer y guardar en segundo plano; 1 proceso)", variable=self.pipeline_var).grid(row=3, column=3, sticky="w", padx=6)
+        ttk.Label(rend_frame, text="Compresión .docx (0-9):").grid(row=4, column=0, sticky="w")
+        self.compresion_spin = ttk.Spinbox(rend_frame, from_=0, to=9, width=5)
+        self.compresion_spin.set("6")
+        self.compresion_spin.grid(row=4, column=1, sticky="w")
+        ttk.Label(rend_frame, text="Nombres Excel:").grid(row=2, column=0, sticky="w")
+        self.patrones_excel_entry = ttk.Entry(rend_frame, width=30)
+        self.patrones_excel_entry.grid(row=2, column=1, sticky="w")
+        self.patrones_excel_entry.insert(0, "{calicata}.xlsx")
+        self.recursivo_excel_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(rend_frame, text="Buscar también en subcarpetas", variable=self.recursivo_excel_var).grid(row=2, column=2, sticky="w", padx=6)
+        self.cache_valores_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(rend_frame, text="Caché de valores Excel (no releer libros sin cambios)", variable=self.cache_valores_var).grid(row=2, column=3, sticky="w", padx=6)
+        ttk.Label(rend_frame, text="(varios separados por ';', p. ej. {calicata}.xlsx; C-{num:02d} ensayo.xlsx)", foreground="#7f8c8d").grid(row=3, column=0, columnspan=3, sticky="w")
 
         row += 1
         ttk.Separator(inner, orient="horizontal").grid(row=row, column=0, columnspan=3, sticky="ew", pady=8)
@@ -530,7 +2964,7 @@ class CalicataApp:
         self.entry_cell = ttk.Entry(controls, width=30)
         self.entry_cell.grid(row=1, column=1, sticky="w")
         ttk.Label(controls, text="Tipo:").grid(row=1, column=2, sticky="w")
-        self.combo_type = ttk.Combobox(controls, values=["valor", "promedio"], width=15, state="readonly")
+        self.combo_type = ttk.Combobox(controls, values=list(PlanExtraccion.TIPOS), width=15, state="readonly")
         self.combo_type.grid(row=1, column=3, sticky="w")
         self.combo_type.set("valor")
 
@@ -590,6 +3024,15 @@ class CalicataApp:
         self.entry_fixed_height.grid(row=row, column=1, sticky="w")
         self.entry_fixed_height.insert(0, "5.0")
         row += 1
+        opt_frame = ttk.Frame(inner)
+        opt_frame.grid(row=row, column=0, columnspan=3, sticky="w")
+        self.optimizar_imagenes_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(opt_frame, text="Reducir fotos a la altura fija (caché en la carpeta de salida)", variable=self.optimizar_imagenes_var).grid(row=0, column=0, sticky="w")
+        ttk.Label(opt_frame, text="DPI:").grid(row=0, column=1, sticky="w", padx=(10, 0))
+        self.dpi_imagenes_spin = ttk.Spinbox(opt_frame, from_=72, to=600, increment=50, width=5)
+        self.dpi_imagenes_spin.set("200")
+        self.dpi_imagenes_spin.grid(row=0, column=2, sticky="w")
+        row += 1
         self.usar_mapeo_imagenes_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(inner, text="Usar mapeo automático (subcarpetas numeradas)", variable=self.usar_mapeo_imagenes_var, command=self.toggle_mapeo_imagenes).grid(row=row, column=0, columnspan=3, sticky="w")
         row += 1
@@ -649,14 +3092,16 @@ class CalicataApp:
         self.end_range = ttk.Spinbox(proc, from_=1, to=999, width=6)
         self.end_range.set("10")
         self.end_range.grid(row=0, column=4, sticky="w")
+        self.reanudar_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(proc, text="Reanudar", variable=self.reanudar_var).grid(row=0, column=5, sticky="w", padx=(6,0))
 
         self.progress = ttk.Progressbar(proc, orient="horizontal", mode="determinate")
-        self.progress.grid(row=1, column=0, columnspan=5, sticky="ew", pady=6)
+        self.progress.grid(row=1, column=0, columnspan=6, sticky="ew", pady=6)
         self.progress_info = ttk.Label(proc, text="")
-        self.progress_info.grid(row=2, column=0, columnspan=5, sticky="w")
+        self.progress_info.grid(row=2, column=0, columnspan=6, sticky="w")
 
         pb = ttk.Frame(proc)
-        pb.grid(row=3, column=0, columnspan=5, pady=4)
+        pb.grid(row=3, column=0, columnspan=6, pady=4)
         self.process_btn = ttk.Button(pb, text="🚀 Procesar Informes", command=self.run_processing_threaded)
         self.process_btn.pack(side="left", padx=4)
         self.stop_btn = ttk.Button(pb, text="⏹️ Detener", command=self.stop_processing, state="disabled")
@@ -679,6 +3124,11 @@ class CalicataApp:
         lbtns.grid(row=4, column=0, sticky="w", pady=6)
         ttk.Button(lbtns, text="🗑️ Limpiar Log", command=self.clear_log).pack(side="left", padx=4)
         ttk.Button(lbtns, text="💾 Guardar Log", command=self.save_log).pack(side="left", padx=4)
+        ttk.Label(lbtns, text="Nivel:").pack(side="left", padx=(12, 2))
+        self.nivel_log_combo = ttk.Combobox(lbtns, values=list(NIVELES_LOG), width=9, state="readonly")
+        self.nivel_log_combo.set("detalle")
+        self.nivel_log_combo.pack(side="left")
+        self.nivel_log_combo.bind("<<ComboboxSelected>>", lambda e: self.config.setdefault("log_config", {}).update(nivel=self.nivel_log_combo.get()))
 
         # Inicializaciones rápidas
         self.update_status("Listo", "#27ae60")
@@ -687,33 +3137,122 @@ class CalicataApp:
     # Métodos UI / utilitarios
     # -------------------------
 
-    def log(self, text):
+    # cada cuánto drena la GUI los eventos del hilo de trabajo
+    INTERVALO_EVENTOS_MS = 100
+
+    def log(self, text, nivel=logging.INFO):
+        """
+        Seguro desde cualquier hilo: la línea va siempre al archivo de log en el
+        momento y, si alcanza el nivel de log_config, a la ventana en el próximo drenado.
+        """
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        msg = f"[{ts}] {text}\n"
+        linea = f"[{ts}] {text}"
+        try:
+            self.log_archivo.log(nivel, linea)
+        except Exception:
+            pass
+        if nivel >= nivel_log(self.config):
+            self.canal.log(linea + "\n")
+
+    def _marcar_sesion_log(self):
+        """Marca en el archivo el inicio de lo que copiará save_log (inicio de la app o 'Limpiar Log')."""
+        self._marca_log = f"──── sesión {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ({os.getpid()}.{time.perf_counter_ns()}) ────"
         try:
-            self.log_console.insert("end", msg)
-            self.log_console.see("end")
+            self.log_archivo.info(self._marca_log)
         except Exception:
-            print(msg, end="")
+            pass
+
+    def drenar_eventos(self):
+        """
+        Aplica en el hilo de Tk los eventos encolados: todas las líneas de log del
+        lote en una sola inserción y solo el último estado de progreso/estado.
+        """
+        eventos = self.canal.drenar()
+        lineas = []
+        progreso = {}
+        estado = None
+        for ev in eventos:
+            tipo = ev[0]
+            if tipo == "log":
+                lineas.append(ev[1])
+            elif tipo == "progreso":
+                for clave, valor in zip(("valor", "maximo", "texto"), ev[1:]):
+                    if valor is not None:
+                        progreso[clave] = valor
+            elif tipo == "estado":
+                estado = ev[1:]
+            elif tipo == "fin":
+                # aplicar lo acumulado antes de restablecer los controles
+                self._aplicar_eventos(lineas, progreso, estado)
+                lineas, progreso, estado = [], {}, None
+                self._fin_procesamiento(ev[1])
+        self._aplicar_eventos(lineas, progreso, estado)
+        # si quedó cola, volver enseguida
+        self.root.after(1 if len(eventos) >= 2000 else self.INTERVALO_EVENTOS_MS, self.drenar_eventos)
+
+    def _aplicar_eventos(self, lineas, progreso, estado):
+        if lineas:
+            maximo = max(int(self.config.get("log_config", {}).get("lineas_visibles", 2000)), 1)
+            try:
+                self.log_console.insert("end", "".join(lineas[-maximo:]))
+                # ventana acotada: descartar las líneas más antiguas (siguen en el archivo)
+                # cada línea termina en \n: la última línea del widget queda vacía
+                exceso = int(self.log_console.index("end-1c").split(".")[0]) - 1 - maximo
+                if exceso > 0:
+                    self.log_console.delete("1.0", f"{exceso + 1}.0")
+                self.log_console.see("end")
+            except Exception:
+                print("".join(lineas), end="")
+        if "maximo" in progreso:
+            self.progress["maximum"] = progreso["maximo"]
+        if "valor" in progreso:
+            self.progress["value"] = progreso["valor"]
+        if "texto" in progreso:
+            self.progress_info.config(text=progreso["texto"])
+        if estado is not None:
+            self._aplicar_estado(*estado)
 
     def clear_log(self):
         self.log_console.delete("1.0", "end")
+        self._marcar_sesion_log()
+
+    def contenido_log_sesion(self):
+        """
+        Log completo del disco (con todos los niveles y las rotaciones, no solo lo
+        visible) desde el inicio de la app o el último 'Limpiar Log'.
+        """
+        self.log_handler.flush()
+        contenido = b""
+        for a in archivos_log(self.log_handler):
+            with open(a, "rb") as f:
+                contenido += f.read()
+        marca = self._marca_log.encode("utf-8")
+        inicio = contenido.rfind(marca)
+        if inicio < 0:
+            return contenido  # la marca ya salió de las rotaciones: todo lo que queda es de la sesión
+        inicio = contenido.find(b"\n", inicio)
+        return contenido[inicio + 1:] if inicio >= 0 else b""
 
     def save_log(self):
-        content = self.log_console.get("1.0", "end")
-        if not content.strip():
+        """Guarda en un archivo el log completo de la sesión (ver contenido_log_sesion)."""
+        contenido = self.contenido_log_sesion()
+        if not contenido.strip():
             messagebox.showinfo("Guardar log", "No hay contenido en el log.")
             return
         path = filedialog.asksaveasfilename(defaultextension=".txt", filetypes=[("Text files","*.txt")])
         if path:
             try:
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                with open(path, "wb") as destino:
+                    destino.write(contenido)
                 messagebox.showinfo("Guardado", f"Log guardado en:\n{path}")
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo guardar el log:\n{str(e)}")
 
     def update_status(self, text, color=None):
+        """Seguro desde cualquier hilo (se aplica en el próximo drenado)."""
+        self.canal.estado(text, color)
+
+    def _aplicar_estado(self, text, color=None):
         try:
             self.status_label.config(text=text)
             if color:
@@ -897,82 +3436,13 @@ class CalicataApp:
             self.log(f"❌ Error analizando documento: {str(e)}")
 
     def seleccionar_imagen_por_subcarpeta(self, root_folder, sub_num):
-        """
-        Busca subcarpeta que contenga el número indicado (ej: '01', 'C-01', 'Imágenes 01').
-        Si no encuentra, intenta seleccionar por orden de modificación.
-        """
-        if not os.path.exists(root_folder):
-            return None
-        # buscar subcarpeta con número
-        entries = [d for d in os.listdir(root_folder) if os.path.isdir(os.path.join(root_folder, d))]
-        # prefer exact numeric suffixes or contains numeric sequence
-        pattern = re.compile(r"(\d{1,3})")
-        for d in entries:
-            m = pattern.search(d)
-            if m:
-                if int(m.group(1)) == sub_num:
-                    return os.path.join(root_folder, d)
-        # fallback: orden por fecha
-        try:
-            entries_full = [os.path.join(root_folder, d) for d in entries]
-            entries_full.sort(key=lambda x: os.path.getmtime(x))
-            idx = sub_num - 1
-            if idx < len(entries_full):
-                return entries_full[idx]
-        except Exception:
-            pass
-        return None
+        return seleccionar_imagen_por_subcarpeta(root_folder, sub_num)
 
     def obtener_imagenes_ordenadas(self, subcarpeta):
-        exts = ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']
-        if not subcarpeta or not os.path.exists(subcarpeta):
-            return []
-        files = [os.path.join(subcarpeta, f) for f in os.listdir(subcarpeta) if any(f.lower().endswith(e) for e in exts)]
-        files.sort(key=lambda x: os.path.getmtime(x))
-        return files
+        return obtener_imagenes_ordenadas(subcarpeta)
 
     def procesar_imagenes_calicata(self, doc, calicata, numero):
-        """
-        Reemplazos según mapeo automático (imagen_config.imagen_mapeos):
-          - Busca la subcarpeta correspondiente (por número).
-          - Reemplaza las imágenes por orden (más antigua -> primero).
-        """
-        root = self.imagenes_folder_entry.get().strip() or self.config.get("imagenes_folder", "")
-        if not root or not os.path.exists(root):
-            self.log(f"⚠️ No hay carpeta de imágenes configurada.")
-            return
-        subcarpeta = self.seleccionar_imagen_por_subcarpeta(root, numero)
-        if not subcarpeta or not os.path.exists(subcarpeta):
-            self.log(f"⚠️ No se encontró subcarpeta para {calicata} (buscando {numero}).")
-            return
-        imgs = self.obtener_imagenes_ordenadas(subcarpeta)
-        if not imgs:
-            self.log(f"⚠️ Subcarpeta {os.path.basename(subcarpeta)} no contiene imágenes.")
-            return
-
-        imgs_doc = listar_imagenes_doc(doc)
-        for m in self.config["imagen_config"].get("imagen_mapeos", []):
-            pos = m.get("posicion", 1) - 1
-            subidx = m.get("imagen_subcarpeta", 1) - 1
-            # elegir imagen en la subcarpeta según índice
-            if subidx < 0 or subidx >= len(imgs):
-                self.log(f"⚠️ Sub índice {subidx+1} fuera de rango en subcarpeta {subcarpeta}")
-                continue
-            if pos < 0 or pos >= len(imgs_doc):
-                self.log(f"⚠️ Posición imagen {pos+1} no encontrada en el documento")
-                continue
-            ruta_nueva = imgs[subidx]
-            info = imgs_doc[pos]
-            try:
-                fixed_h = None
-                try:
-                    fixed_h = float(self.entry_fixed_height.get() or self.config.get("fixed_image_height", 5.0))
-                except Exception:
-                    fixed_h = self.config.get("fixed_image_height", 5.0)
-                reemplazar_imagen(info["run"], ruta_nueva, fixed_h)
-                self.log(f"🖼️ Imagen {pos+1} reemplazada por {os.path.basename(ruta_nueva)}")
-            except Exception as e:
-                self.log(f"⚠️ Error reemplazando imagen {pos+1}: {str(e)}")
+        return procesar_imagenes_calicata(doc, calicata, numero, self.config, self.log)
 
     def procesar_imagenes_consolidado(self, doc, start_val, end_val):
         # toma la primera calicata como ejemplo
@@ -984,12 +3454,8 @@ class CalicataApp:
 
     def buscar_archivo_excel(self, calicata):
         """Buscar calicata.xlsx en carpetas configuradas"""
-        for carpeta in [self.excel_folder_entry_1.get().strip(), self.excel_folder_entry_2.get().strip(), self.config.get("excel_folder_1",""), self.config.get("excel_folder_2","")]:
-            if carpeta and os.path.exists(carpeta):
-                candidate = os.path.join(carpeta, f"{calicata}.xlsx")
-                if os.path.exists(candidate):
-                    return candidate
-        return None
+        carpetas = [self.excel_folder_entry_1.get().strip(), self.excel_folder_entry_2.get().strip(), self.config.get("excel_folder_1",""), self.config.get("excel_folder_2","")]
+        return buscar_archivo_excel(carpetas, calicata)
 
     # -------------------------
     # Guardar/Cargar/Reset config
@@ -1013,12 +3479,29 @@ class CalicataApp:
             "table_font": self.table_font.get(),
             "table_size": int(self.table_size.get())
         }
+        self.config["reemplazo_config"] = {
+            "conservar_formato": bool(self.conservar_formato_var.get())
+        }
+        self.config["log_config"] = {
+            "nivel": self.nivel_log_combo.get() or "detalle",
+            "lineas_visibles": self.config.get("log_config", {}).get("lineas_visibles", 2000)
+        }
+        try:
+            nivel = min(max(int(self.compresion_spin.get()), 0), 9)
+        except Exception:
+            nivel = 6
         self.config["archivo_config"] = {
             "nombre_base": self.nombre_base_entry.get().strip(),
             "usar_sufijo": bool(self.usar_sufijo_var.get()),
-            "sufijo_personalizado": self.sufijo_entry.get().strip()
+            "sufijo_personalizado": self.sufijo_entry.get().strip(),
+            "nivel_compresion": nivel
         }
         self.config["imagen_config"]["usar_mapeo_automatico"] = bool(self.usar_mapeo_imagenes_var.get())
+        self.config["imagen_config"]["optimizar"] = bool(self.optimizar_imagenes_var.get())
+        try:
+            self.config["imagen_config"]["dpi"] = max(int(self.dpi_imagenes_spin.get()), 1)
+        except Exception:
+            self.config["imagen_config"]["dpi"] = 200
         self.config["informe_config"] = {
             "tipo_informe": self.tipo_informe_var.get(),
             "consolidado_nombre": self.consolidado_nombre_entry.get().strip()
@@ -1027,6 +3510,27 @@ class CalicataApp:
             "usar_decimales_fijos": bool(self.usar_decimales_var.get()),
             "cantidad_decimales": int(self.decimales_spin.get())
         }
+        self.config["excel_config"] = {
+            "modo_lectura": self.modo_lectura_combo.get() or "completo",
+            "medir_recursos": bool(self.medir_excel_var.get()),
+            "patrones": [p.strip() for p in self.patrones_excel_entry.get().split(";") if p.strip()] or ["{calicata}.xlsx"],
+            "recursivo": bool(self.recursivo_excel_var.get()),
+            "cache_valores": bool(self.cache_valores_var.get()),
+            "ruta_cache": self.config.get("excel_config", {}).get("ruta_cache", "")
+        }
+        try:
+            procesos = max(int(self.procesos_spin.get()), 1)
+        except Exception:
+            procesos = 1
+        self.config["procesamiento_config"] = {
+            "procesos": procesos,
+            "incremental": bool(self.incremental_var.get()),
+            "medir_etapas": bool(self.medir_etapas_var.get()),
+            "perfilar": bool(self.perfilar_var.get()),
+            "pipeline": bool(self.pipeline_var.get()),
+            "anticipacion": self.config.get("procesamiento_config", {}).get("anticipacion", 3),
+            "hilos_escritura": self.config.get("procesamiento_config", {}).get("hilos_escritura", 2)
+        }
         # mappings, replacements and imagen_mapeos are updated as user modifies trees (we kept them in sync earlier)
 
     def guardar_config_json(self):
@@ -1060,12 +3564,17 @@ class CalicataApp:
             self.output_folder_entry.delete(0,"end"); self.output_folder_entry.insert(0, self.config.get("output_folder",""))
             self.imagenes_folder_entry.delete(0,"end"); self.imagenes_folder_entry.insert(0, self.config.get("imagenes_folder",""))
             self.entry_fixed_height.delete(0,"end"); self.entry_fixed_height.insert(0, str(self.config.get("fixed_image_height",5.0)))
+            ic = self.config.get("imagen_config",{})
+            self.optimizar_imagenes_var.set(ic.get("optimizar", True))
+            self.dpi_imagenes_spin.set(str(ic.get("dpi",200)))
             # fuentes
             fc = self.config.get("font_config",{})
             self.paragraph_font.set(fc.get("paragraph_font","Calibri"))
             self.paragraph_size.set(str(fc.get("paragraph_size",11)))
             self.table_font.set(fc.get("table_font","Calibri"))
             self.table_size.set(str(fc.get("table_size",11)))
+            self.conservar_formato_var.set(self.config.get("reemplazo_config",{}).get("conservar_formato", False))
+            self.nivel_log_combo.set(self.config.get("log_config",{}).get("nivel","detalle"))
             # archivo cfg
             ac = self.config.get("archivo_config",{})
             self.nombre_base_entry.delete(0,"end"); self.nombre_base_entry.insert(0, ac.get("nombre_base","EMS CUSCO C-"))
@@ -1081,6 +3590,20 @@ class CalicataApp:
             dec = self.config.get("decimales_config",{})
             self.usar_decimales_var.set(dec.get("usar_decimales_fijos", True))
             self.decimales_spin.set(str(dec.get("cantidad_decimales",1)))
+            # rendimiento
+            xc = self.config.get("excel_config",{})
+            self.modo_lectura_combo.set(xc.get("modo_lectura","completo"))
+            self.medir_excel_var.set(xc.get("medir_recursos", False))
+            self.patrones_excel_entry.delete(0,"end"); self.patrones_excel_entry.insert(0, "; ".join(xc.get("patrones") or ["{calicata}.xlsx"]))
+            self.recursivo_excel_var.set(xc.get("recursivo", False))
+            self.cache_valores_var.set(xc.get("cache_valores", True))
+            pc = self.config.get("procesamiento_config",{})
+            self.procesos_spin.set(str(pc.get("procesos",1)))
+            self.incremental_var.set(pc.get("incremental", False))
+            self.medir_etapas_var.set(pc.get("medir_etapas", False))
+            self.perfilar_var.set(pc.get("perfilar", False))
+            self.pipeline_var.set(pc.get("pipeline", False))
+            self.compresion_spin.set(str(self.config.get("archivo_config", {}).get("nivel_compresion", 6)))
             # limpiar trees
             for t in (self.mapping_tree, self.replace_tree, self.imagen_tree):
                 for it in t.get_children():
@@ -1110,27 +3633,27 @@ class CalicataApp:
         self.sufijo_entry.config(state="disabled"); self.sufijo_entry.delete(0,"end")
         self.consolidado_nombre_entry.delete(0,"end"); self.consolidado_nombre_entry.insert(0, "Informe_Consolidado")
         self.entry_fixed_height.delete(0,"end"); self.entry_fixed_height.insert(0, "5.0")
+        self.optimizar_imagenes_var.set(True)
+        self.dpi_imagenes_spin.set("200")
+        self.modo_lectura_combo.set("completo")
+        self.medir_excel_var.set(False)
+        self.patrones_excel_entry.delete(0,"end"); self.patrones_excel_entry.insert(0, "{calicata}.xlsx")
+        self.recursivo_excel_var.set(False)
+        self.cache_valores_var.set(True)
+        self.conservar_formato_var.set(False)
+        self.nivel_log_combo.set("detalle")
+        self.procesos_spin.set("1")
+        self.incremental_var.set(False)
+        self.medir_etapas_var.set(False)
+        self.perfilar_var.set(False)
+        self.pipeline_var.set(False)
+        self.compresion_spin.set("6")
         # limpiar árboles
         for t in (self.mapping_tree, self.replace_tree, self.imagen_tree):
             for it in t.get_children():
                 t.delete(it)
         # reset config
-        self.config = {
-            "docx_path": "",
-            "excel_folder_1": "",
-            "excel_folder_2": "",
-            "output_folder": "",
-            "mappings": [],
-            "text_replacements": [],
-            "imagenes_folder": "",
-            "image_replacements": [],
-            "fixed_image_height": 5.0,
-            "font_config": {"paragraph_font":"Calibri", "paragraph_size":11, "table_font":"Calibri", "table_size":11},
-            "archivo_config": {"nombre_base":"EMS CUSCO C-", "usar_sufijo":True, "sufijo_personalizado":""},
-            "imagen_config": {"usar_mapeo_automatico": False, "imagen_mapeos": []},
-            "informe_config": {"tipo_informe": "individual", "consolidado_nombre": "Informe_Consolidado"},
-            "decimales_config": {"usar_decimales_fijos": True, "cantidad_decimales": 1}
-        }
+        self.config = config_por_defecto()
         self.log("🗑️ Configuración limpiada.")
 
     # -------------------------
@@ -1205,6 +3728,8 @@ class CalicataApp:
         tipo = self.tipo_informe_var.get()
         if tipo == "individual":
             msg = f"¿Procesar {count} calicatas individuales (C-{start_val:02d} a C-{end_val:02d})?"
+            if self.reanudar_var.get():
+                msg += "\n\nSe reanudará la ejecución anterior: se omiten las calicatas ya completadas."
         else:
             msg = f"¿Crear informe consolidado con {count} calicatas (C-{start_val:02d} a C-{end_val:02d})?"
         if not messagebox.askyesno("Confirmar", msg):
@@ -1214,10 +3739,12 @@ class CalicataApp:
         self.processing = True
         self.process_btn.config(state="disabled")
         self.stop_btn.config(state="normal")
-        # guardar config actual
+        # guardar config actual (los widgets se leen aquí, en el hilo de Tk)
         self.save_config()
+        self.sincronizar_trees_config()
+        reanudar = bool(self.reanudar_var.get())
         # start thread
-        t = threading.Thread(target=self.run_processing, daemon=True)
+        t = threading.Thread(target=self.run_processing, args=(tipo, start_val, end_val, reanudar), daemon=True)
         t.start()
 
     def validate_config(self):
@@ -1230,6 +3757,11 @@ class CalicataApp:
             errs.append("- Seleccione una carpeta de salida válida.")
         if not self.mapping_tree.get_children():
             errs.append("- Configure al menos un mapeo Excel ↔ Word.")
+        for patron in self.patrones_excel_entry.get().split(";"):
+            try:
+                patron.strip().format(calicata="C-01", num=1)
+            except (KeyError, IndexError, ValueError):
+                errs.append(f"- Nombre de Excel inválido: {patron.strip()} (use {{calicata}} o {{num}}).")
         return errs
 
     def stop_processing(self):
@@ -1237,261 +3769,222 @@ class CalicataApp:
         self.update_status("Deteniendo...", "#f39c12")
         self.log("⏹️ Solicitado detener procesamiento...")
 
-    def run_processing(self):
+    def run_processing(self, tipo, start_val, end_val, reanudar=False):
+        """Hilo de trabajo: no toca widgets, todo sale por self.canal."""
+        error = None
         try:
             self.update_status("Procesando...", "#f39c12")
-            tipo = self.tipo_informe_var.get()
-            start_val = int(self.start_range.get())
-            end_val = int(self.end_range.get())
-            if tipo == "individual":
-                self.procesar_informes_individuales(start_val, end_val)
-            else:
-                self.procesar_informe_consolidado(start_val, end_val)
+            self.crear_procesador().ejecutar(tipo, start_val, end_val, reanudar)
         except Exception as e:
-            self.log(f"❌ Error crítico: {str(e)}")
-            messagebox.showerror("Error crítico", str(e))
+            error = str(e)
+            self.log(f"❌ Error crítico: {error}")
             self.update_status("Error", "#e74c3c")
         finally:
-            self.processing = False
-            self.process_btn.config(state="normal")
-            self.stop_btn.config(state="disabled")
-            self.progress["value"] = 0
+            self.canal.fin(error)
+
+    def _fin_procesamiento(self, error=None):
+        """En el hilo de Tk, al recibir el evento 'fin' del hilo de trabajo."""
+        self.processing = False
+        self.process_btn.config(state="normal")
+        self.stop_btn.config(state="disabled")
+        self.progress["value"] = 0
+        if error:
+            messagebox.showerror("Error crítico", error)
 
     def generar_nombre_archivo(self, numero):
-        base = self.nombre_base_entry.get().strip() or self.config["archivo_config"]["nombre_base"]
-        usar_suf = self.usar_sufijo_var.get()
-        if usar_suf:
-            return f"{base}{numero:02d}"
-        else:
-            s = self.sufijo_entry.get().strip()
-            return f"{base}{s}" if s else base
+        archivo_config = {
+            "nombre_base": self.nombre_base_entry.get().strip() or self.config["archivo_config"]["nombre_base"],
+            "usar_sufijo": self.usar_sufijo_var.get(),
+            "sufijo_personalizado": self.sufijo_entry.get().strip()
+        }
+        return generar_nombre_archivo(archivo_config, numero)
 
-    def procesar_informes_individuales(self, start_val, end_val):
-        total = end_val - start_val + 1
-        self.progress["maximum"] = total
-        processed = 0
-        errors = 0
-        self.log(f"🚀 Iniciando procesamiento individual: {start_val}..{end_val}")
-        # ensure config mapping list in sync
-        # update config mappings from tree in case user changed and didn't save
+    def sincronizar_trees_config(self):
+        """Copiar mapeos y reemplazos de los trees a self.config (por si no se guardaron)."""
         self.config["mappings"] = []
         for it in self.mapping_tree.get_children():
             v = self.mapping_tree.item(it)["values"]
             self.config["mappings"].append({"encabezado": v[0], "hoja": v[1], "celda": v[2], "tipo": v[3]})
-
-        # update replacements
         self.config["text_replacements"] = []
         for it in self.replace_tree.get_children():
             v = self.replace_tree.item(it)["values"]
             self.config["text_replacements"].append((v[0], v[1]))
 
-        for i in range(start_val, end_val + 1):
-            if self.stop_processing_flag:
-                self.log("⏹️ Procesamiento detenido por el usuario.")
-                break
-            calicata = f"C-{i:02d}"
-            self.progress_info.config(text=f"Procesando {calicata} ({i-start_val+1}/{total})")
-            try:
-                doc = Document(self.docx_entry.get().strip())
-                # reemplazar marcador base
-                reemplazar_texto_global(doc, "C-01", calicata)
-
-                # aplicar reemplazos en orden
-                for old, new in self.config.get("text_replacements", []):
-                    reemplazar_texto_global(doc, old, new)
-
-                aplicar_formato_documento(doc, self.config["font_config"])
+    def actualizar_progreso(self, valor=None, maximo=None, texto=None):
+        """Seguro desde cualquier hilo (se aplica en el próximo drenado)."""
+        self.canal.progreso(valor, maximo, texto)
 
-                excel_path = self.buscar_archivo_excel(calicata)
-                if not excel_path:
-                    raise FileNotFoundError(f"No se encontró archivo Excel para {calicata}")
-
-                # aplicar mapeos
-                for mapping in self.config.get("mappings", []):
-                    try:
-                        val = extraer_dato_excel_mejorado(excel_path, mapping["hoja"], mapping["celda"], mapping["tipo"], self.config["decimales_config"])
-                        insertar_datos_en_tablas_mejorado(doc, mapping["encabezado"], val, self.config["font_config"])
-                        self.log(f"  ✅ {mapping['encabezado']} = {val}")
-                    except Exception as e:
-                        self.log(f"  ⚠️ Error mapeo {mapping.get('encabezado')}: {str(e)}")
-
-                # imágenes
-                if self.usar_mapeo_imagenes_var.get():
-                    self.config["imagen_config"]["imagen_mapeos"] = self.config.get("imagen_config", {}).get("imagen_mapeos", self.config["imagen_config"].get("imagen_mapeos", []))
-                    self.procesar_imagenes_calicata(doc, calicata, i)
-
-                # nombre y guardar
-                nombre = self.generar_nombre_archivo(i)
-                outpath = os.path.join(self.output_folder_entry.get().strip(), f"{nombre}.docx")
-                doc.save(outpath)
-                processed += 1
-                self.log(f"✅ {calicata} -> {os.path.basename(outpath)}")
-            except Exception as e:
-                errors += 1
-                self.log(f"❌ Error con {calicata}: {str(e)}")
-            finally:
-                self.progress["value"] = processed + errors
-                self.root.update_idletasks()
+    def crear_procesador(self):
+        return ProcesadorInformes(self.config, log_con_nivel=self.log, progreso=self.actualizar_progreso,
+                                  estado=self.update_status, detener=lambda: self.stop_processing_flag)
 
-        # resumen
-        if not self.stop_processing_flag:
-            if errors == 0:
-                self.log(f"🎉 Procesamiento completado: {processed} archivos generados.")
-                self.update_status("Completado", "#27ae60")
-            else:
-                self.log(f"⚠️ Procesamiento finalizó con {errors} errores. {processed} exitosos.")
-                self.update_status("Completado con errores", "#f39c12")
-        else:
-            self.update_status("Detenido", "#e74c3c")
+    def procesar_informes_individuales(self, start_val, end_val, reanudar=False):
+        self.sincronizar_trees_config()
+        return self.crear_procesador().procesar_individuales(start_val, end_val, reanudar)
 
     def procesar_informe_consolidado(self, start_val, end_val):
-        total = end_val - start_val + 1
-        self.progress["maximum"] = total
-        self.progress["value"] = 0
-        self.log(f"🚀 Iniciando informe consolidado: {start_val}..{end_val}")
-
-        # preparar mappings y reemplazos desde los trees
-        self.config["mappings"] = []
-        for it in self.mapping_tree.get_children():
-            v = self.mapping_tree.item(it)["values"]
-            self.config["mappings"].append({"encabezado": v[0], "hoja": v[1], "celda": v[2], "tipo": v[3]})
-        self.config["text_replacements"] = []
-        for it in self.replace_tree.get_children():
-            v = self.replace_tree.item(it)["values"]
-            self.config["text_replacements"].append((v[0], v[1]))
-
-        # abrir doc base
-        try:
-            doc = Document(self.docx_entry.get().strip())
-            aplicar_formato_documento(doc, self.config["font_config"])
-            for old, new in self.config.get("text_replacements", []):
-                reemplazar_texto_global(doc, old, new)
-
-            datos_consolidados = {}
-            for i in range(start_val, end_val + 1):
-                if self.stop_processing_flag:
-                    self.log("⏹️ Procesamiento detenido por el usuario.")
-                    return
-                calicata = f"C-{i:02d}"
-                self.progress_info.config(text=f"Recopilando {calicata} ({i-start_val+1}/{total})")
-                try:
-                    excel_path = self.buscar_archivo_excel(calicata)
-                    if not excel_path:
-                        self.log(f"⚠️ No encontrado Excel para {calicata}")
-                        datos_consolidados[calicata] = {}
-                        continue
-                    datos = {}
-                    for mapping in self.config.get("mappings", []):
-                        try:
-                            val = extraer_dato_excel_mejorado(excel_path, mapping["hoja"], mapping["celda"], mapping["tipo"], self.config["decimales_config"])
-                            datos[mapping["encabezado"]] = val
-                        except Exception:
-                            datos[mapping["encabezado"]] = ""
-                    datos_consolidados[calicata] = datos
-                except Exception as e:
-                    self.log(f"⚠️ Error recopilando {calicata}: {str(e)}")
-                    datos_consolidados[calicata] = {}
-                self.progress["value"] = i - start_val + 1
-                self.root.update_idletasks()
-
-            # insertar en tablas:
-            self.insertar_datos_consolidados(doc, datos_consolidados)
-            # imágenes
-            if self.usar_mapeo_imagenes_var.get():
-                self.procesar_imagenes_consolidado(doc, start_val, end_val)
-            # guardar
-            nombre = self.consolidado_nombre_entry.get().strip() or self.config["informe_config"].get("consolidado_nombre","Informe_Consolidado")
-            outpath = os.path.join(self.output_folder_entry.get().strip(), f"{nombre}.docx")
-            doc.save(outpath)
-            self.log(f"🎉 Informe consolidado guardado: {os.path.basename(outpath)}")
-            self.update_status("Completado", "#27ae60")
-        except Exception as e:
-            self.log(f"❌ Error generando consolidado: {str(e)}")
-            self.update_status("Error", "#e74c3c")
+        self.sincronizar_trees_config()
+        return self.crear_procesador().procesar_consolidado(start_val, end_val)
 
     def insertar_datos_consolidados(self, doc, datos_consolidados):
-        """
-        Inserta valores en las tablas del doc en base a datos_consolidados:
-        datos_consolidados = { "C-01": { "EncabezadoFila": valor, ... }, ... }
-        El algoritmo intenta encontrar columnas que coincidan con los nombres de calicata.
-        """
-        try:
-            for tabla in doc.tables:
-                if not tabla.rows:
-                    continue
-                headers = [c.text.strip() for c in tabla.rows[0].cells]
-                cal_cols = {}
-                for idx, head in enumerate(headers):
-                    for cal in datos_consolidados.keys():
-                        if cal in head or head in cal:
-                            cal_cols[idx] = cal
-                            break
-                for r_idx in range(1, len(tabla.rows)):
-                    row = tabla.rows[r_idx]
-                    row_header = row.cells[0].text.strip() if row.cells else ""
-                    for col_idx, cal in cal_cols.items():
-                        if col_idx < len(row.cells):
-                            datos = datos_consolidados.get(cal, {})
-                            if row_header in datos:
-                                val = datos[row_header]
-                                row.cells[col_idx].text = str(val)
-                                # formato en cell
-                                for p in row.cells[col_idx].paragraphs:
-                                    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                    for run in p.runs:
-                                        try:
-                                            run.font.name = self.config["font_config"]["table_font"]
-                                            run.font.size = Pt(self.config["font_config"]["table_size"])
-                                        except Exception:
-                                            pass
-        except Exception as e:
-            self.log(f"⚠️ Error insertando datos consolidados: {str(e)}")
+        insertar_datos_consolidados(doc, datos_consolidados, self.config["font_config"], self.log)
 
 # ---------------------------
 # Método de compatibilidad para insertar datos en tablas por encabezado
 # ---------------------------
 
-def insertar_datos_en_tablas_mejorado(doc, encabezado, valor, font_config=None):
+def _escribir_columna(tabla, idx, valor, font_config=None):
+    """Escribe 'valor' en la columna idx de todas las filas de datos de la tabla."""
+    for row in tabla.rows[1:]:
+        if idx < len(row.cells):
+            cell = row.cells[idx]
+            cell.text = str(valor)
+            for p in cell.paragraphs:
+                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                for run in p.runs:
+                    try:
+                        if font_config:
+                            run.font.name = font_config.get("table_font", "Calibri")
+                            run.font.size = Pt(font_config.get("table_size", 11))
+                    except Exception:
+                        pass
+            try:
+                cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            except Exception:
+                pass
+
+def insertar_datos_en_tablas_mejorado(doc, encabezado, valor, font_config=None, indice=None):
     """
     Busca la columna cuyo encabezado sea exactamente 'encabezado' en la primera fila de cada tabla
     y escribe 'valor' en todas las celdas de esa columna (filas de datos).
+    Con un IndicePlantilla la búsqueda es una consulta al índice (solo las tablas
+    volátiles se vuelven a leer).
     """
     try:
-        for tabla in doc.tables:
+        tablas = doc.tables
+        if indice is not None:
+            for t_idx, idx in indice.columnas.get(encabezado, []):
+                _escribir_columna(tablas[t_idx], idx, valor, font_config)
+            candidatas = [tablas[t_idx] for t_idx in indice.tablas_volatiles]
+        else:
+            candidatas = tablas
+        for tabla in candidatas:
             if not tabla.rows:
                 continue
             headers = [cell.text.strip() for cell in tabla.rows[0].cells]
             for idx, h in enumerate(headers):
                 if h == encabezado:
-                    for row in tabla.rows[1:]:
-                        if idx < len(row.cells):
-                            cell = row.cells[idx]
-                            cell.text = str(valor)
-                            for p in cell.paragraphs:
-                                p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                for run in p.runs:
-                                    try:
-                                        if font_config:
-                                            run.font.name = font_config.get("table_font", "Calibri")
-                                            run.font.size = Pt(font_config.get("table_size", 11))
-                                    except Exception:
-                                        pass
-                            try:
-                                cell.vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                            except Exception:
-                                pass
+                    _escribir_columna(tabla, idx, valor, font_config)
                     break
     except Exception:
         pass
 
+# ---------------------------
+# Línea de comandos (sin GUI)
+# ---------------------------
+
+def parsear_rango(texto):
+    """'1-250' -> (1, 250); '7' -> (7, 7)."""
+    partes = [p.strip() for p in str(texto).split("-")]
+    if len(partes) == 1:
+        inicio = fin = int(partes[0])
+    elif len(partes) == 2:
+        inicio, fin = int(partes[0]), int(partes[1])
+    else:
+        raise ValueError(f"Rango inválido: {texto}")
+    if inicio < 1 or inicio > fin:
+        raise ValueError(f"Rango inválido: {texto}")
+    return inicio, fin
+
+def log_consola(text):
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    print(f"[{ts}] {text}", flush=True)
+
+def main_cli(argv):
+    parser = argparse.ArgumentParser(prog="Generador-de-Informes.py", description="Generador de informes por calicata (modo sin GUI).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    comunes = argparse.ArgumentParser(add_help=False)
+    comunes.add_argument("--config", required=True, help="JSON creado con 'Guardar Configuración'.")
+    comunes.add_argument("--range", dest="rango", required=True, help="Rango de calicatas, ej. 1-250.")
+    comunes.add_argument("--perfilar", action="store_true", help="Ejecutar bajo cProfile: perfil_*.prof en la carpeta de salida y resumen en el log.")
+    comunes.add_argument("--nivel", choices=list(NIVELES_LOG), default=None, help="Nivel del log (por defecto el del JSON; 'detalle' muestra cada mapeo).")
+    informes = argparse.ArgumentParser(add_help=False)
+    informes.add_argument("--workers", type=int, default=None, help="Procesos paralelos (por defecto el valor del JSON).")
+    informes.add_argument("--tipo", choices=["individual", "consolidado"], default=None, help="Tipo de informe (por defecto el del JSON).")
+    informes.add_argument("--incremental", action="store_true", help="Regenerar solo las calicatas cuyas entradas cambiaron.")
+    informes.add_argument("--reanudar", action="store_true", help="Continuar la ejecución anterior desde la primera calicata sin terminar.")
+    informes.add_argument("--pipeline", action="store_true", help="Leer las próximas calicatas y guardar los informes en segundo plano (un proceso).")
+    informes.add_argument("--medir-etapas", action="store_true", help="Medir cada etapa y exportar rendimiento_*.json/.csv a la carpeta de salida.")
+    run = sub.add_parser("run", parents=[comunes, informes], help="Procesar un rango de calicatas con una configuración JSON guardada.")
+    run.add_argument("--sin-cache-valores", action="store_true", help="Leer todos los Excel sin usar ni actualizar la caché de valores.")
+    extract = sub.add_parser("extract", parents=[comunes], help="Leer los Excel del rango y guardar sus valores en un dataset CSV (sin generar informes).")
+    extract.add_argument("--dataset", default=None, help=f"CSV de salida (por defecto {DatasetCalicatas.NOMBRE} en la carpeta de salida).")
+    extract.add_argument("--sin-cache-valores", action="store_true", help="Leer todos los Excel sin usar ni actualizar la caché de valores.")
+    render = sub.add_parser("render", parents=[comunes, informes], help="Generar los informes a partir de un dataset CSV, sin abrir los Excel.")
+    render.add_argument("--dataset", required=True, help="CSV escrito por 'extract'.")
+    args = parser.parse_args(argv)
+
+    try:
+        config = cargar_config(args.config)
+        start_val, end_val = parsear_rango(args.rango)
+    except Exception as e:
+        log_consola(f"❌ {str(e)}")
+        return 2
+    pc = config.setdefault("procesamiento_config", {})
+    # 'run' siempre lee los Excel; 'render' solo el dataset
+    pc["dataset"] = os.path.abspath(args.dataset) if args.comando == "render" else ""
+    if getattr(args, "workers", None) is not None:
+        pc["procesos"] = max(args.workers, 1)
+    if getattr(args, "tipo", None):
+        config.setdefault("informe_config", {})["tipo_informe"] = args.tipo
+    if getattr(args, "incremental", False):
+        pc["incremental"] = True
+    if getattr(args, "sin_cache_valores", False):
+        config.setdefault("excel_config", {})["cache_valores"] = False
+    if args.nivel:
+        config.setdefault("log_config", {})["nivel"] = args.nivel
+    if getattr(args, "medir_etapas", False):
+        pc["medir_etapas"] = True
+    if getattr(args, "pipeline", False):
+        pc["pipeline"] = True
+    if args.perfilar:
+        pc["perfilar"] = True
+    errors = validar_config(config)
+    if errors:
+        log_consola("❌ Errores de configuración:\n" + "\n".join(errors))
+        return 2
+
+    detener = threading.Event()
+    procesador = ProcesadorInformes(config, log=log_consola, detener=detener.is_set)
+    try:
+        if args.comando == "extract":
+            resultado = procesador.ejecutar("extraccion", start_val, end_val, dataset=args.dataset)
+        else:
+            resultado = procesador.ejecutar(config["informe_config"].get("tipo_informe", "individual"), start_val, end_val, args.reanudar)
+    except KeyboardInterrupt:
+        detener.set()
+        log_consola("⏹️ Interrumpido.")
+        return 130
+    return 0 if resultado["errores"] == 0 and not resultado["detenido"] else 1
+
 # ---------------------------
 # MAIN
 # ---------------------------
 
-if __name__ == "__main__":
+def main_gui():
+    global tk, filedialog, messagebox, ttk
+    import tkinter as tk
+    from tkinter import filedialog, messagebox, ttk
     root = tk.Tk()
     app = CalicataApp(root)
     try:
         root.mainloop()
     except KeyboardInterrupt:
         pass
+
+if __name__ == "__main__":
+    # necesario para el modo paralelo en ejecutables congelados (Windows)
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1:
+        sys.exit(main_cli(sys.argv[1:]))
+    main_gui()
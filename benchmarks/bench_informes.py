@@ -0,0 +1,337 @@
+"""
+Benchmarks reproducibles del Generador de Informes.
+
+Genera entradas sintéticas en una carpeta temporal (plantilla Word con tablas,
+marcadores e imágenes; un C-XX.xlsx por calicata; subcarpetas de fotos), mide
+los flujos individual y consolidado de punta a punta y por etapa, y algunas
+funciones sueltas (extraer_dato_excel_mejorado, reemplazar_texto_global,
+listar_imagenes_doc). El resultado se escribe en JSON.
+
+Uso:
+    python benchmarks/bench_informes.py --calicatas 20 --salida bench.json
+    python benchmarks/bench_informes.py --salida nuevo.json --comparar bench.json --tolerancia 0.2
+
+Con --comparar el código de salida es 1 si alguna mediana empeora más que la tolerancia.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+from docx import Document
+from docx.oxml.ns import qn
+from docx.shared import Cm
+from lxml import etree
+from openpyxl import Workbook
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cargar_generador():
+    """Importa Generador-de-Informes.py (el nombre con guiones no es importable con import)."""
+    if "generador_informes" in sys.modules:
+        return sys.modules["generador_informes"]
+    spec = importlib.util.spec_from_file_location("generador_informes", os.path.join(RAIZ, "Generador-de-Informes.py"))
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+# Los procesos de trabajo (spawn) importan este script como __mp_main__ y luego
+# deserializan funciones de "generador_informes": el módulo tiene que quedar
+# registrado al importar, no solo al ejecutar main().
+if __name__ == "__mp_main__":
+    cargar_generador()
+
+
+# ---------------------------
+# Entradas sintéticas
+# ---------------------------
+
+def escribir_imagen(ruta, ancho, alto, semilla):
+    """Foto de prueba: JPEG con Pillow si está instalado; si no, un PNG de color liso."""
+    color = tuple(random.Random(semilla).randrange(256) for _ in range(3))
+    try:
+        from PIL import Image
+    except ImportError:
+        ruta = os.path.splitext(ruta)[0] + ".png"
+        fila = b"\x00" + bytes(color) * ancho
+        datos = zlib.compress(fila * alto, 6)
+
+        def bloque(tipo, contenido):
+            return struct.pack(">I", len(contenido)) + tipo + contenido + struct.pack(">I", zlib.crc32(tipo + contenido) & 0xFFFFFFFF)
+
+        with open(ruta, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n" + bloque(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 2, 0, 0, 0))
+                    + bloque(b"IDAT", datos) + bloque(b"IEND", b""))
+        return ruta
+    img = Image.effect_noise((ancho, alto), 64).convert("RGB")
+    img.paste(color, (0, 0, ancho // 2, alto // 2))
+    img.save(ruta, "JPEG", quality=90)
+    return ruta
+
+
+def envolver_alternate_content(run):
+    """Envuelve la imagen del run en mc:AlternateContent, como guarda Word algunas imágenes."""
+    mc = "http://schemas.openxmlformats.org/markup-compatibility/2006"
+    dibujo = run._element.find(qn("w:drawing"))
+    alternativa = etree.Element(f"{{{mc}}}AlternateContent", nsmap={"mc": mc})
+    eleccion = etree.SubElement(alternativa, f"{{{mc}}}Choice", Requires="wp14")
+    etree.SubElement(alternativa, f"{{{mc}}}Fallback")
+    dibujo.addprevious(alternativa)
+    eleccion.append(dibujo)
+
+
+def generar_entradas(carpeta, p):
+    """Crea plantilla, libros, fotos y carpeta de salida. Devuelve la config del generador."""
+    encabezados = [f"Param {k + 1}" for k in range(p.mapeos)]
+    xl = os.path.join(carpeta, "excel")
+    fotos = os.path.join(carpeta, "imagenes")
+    salida = os.path.join(carpeta, "salida")
+    for d in (xl, fotos, salida):
+        os.makedirs(d, exist_ok=True)
+
+    # plantilla
+    muestra = escribir_imagen(os.path.join(carpeta, "muestra.jpg"), 400, 300, f"{p.semilla}-muestra")
+    doc = Document()
+    doc.add_heading("Informe de la calicata C-01", level=1)
+    for k in range(p.reemplazos):
+        doc.add_paragraph(f"Proyecto MARCA_{k} ubicado en ZONA_{k}, ensayo de la calicata C-01.")
+    for t in range(p.tablas):
+        propios = encabezados[t::p.tablas] or encabezados[:1]
+        tabla = doc.add_table(rows=p.filas + 1, cols=len(propios) + 1)
+        tabla.rows[0].cells[0].text = "Profundidad"
+        for j, enc in enumerate(propios, 1):
+            tabla.rows[0].cells[j].text = enc
+        for r in range(1, p.filas + 1):
+            tabla.rows[r].cells[0].text = f"{r * 0.5:.1f} m"
+        doc.add_paragraph(f"Tabla {t + 1} - MARCA_0")
+    # tabla para el consolidado: columnas por calicata, filas por encabezado
+    columnas = [f"C-{n:02d}" for n in range(1, min(p.calicatas, 10) + 1)]
+    tabla = doc.add_table(rows=len(encabezados) + 1, cols=len(columnas) + 1)
+    tabla.rows[0].cells[0].text = "Parámetro"
+    for j, cal in enumerate(columnas, 1):
+        tabla.rows[0].cells[j].text = cal
+    for r, enc in enumerate(encabezados, 1):
+        tabla.rows[r].cells[0].text = enc
+    # la primera imagen va envuelta en mc:AlternateContent (debe seguir contando como posición 1)
+    for i in range(p.imagenes):
+        run = doc.add_paragraph().add_run()
+        run.add_picture(muestra, height=Cm(4))
+        if i == 0:
+            envolver_alternate_content(run)
+    plantilla = os.path.join(carpeta, "plantilla.docx")
+    doc.save(plantilla)
+
+    # libros: hoja 'Datos' con p.filas_excel filas x (mapeos + 1) columnas
+    rnd = random.Random(p.semilla)
+    for n in range(1, p.calicatas + 1):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = "Datos"
+        for fila in range(1, p.filas_excel + 1):
+            ws.append([f"fila {fila}"] + [round(rnd.uniform(0, 100), 3) for _ in range(p.mapeos)])
+        wb.create_sheet("Notas").append(["sin uso"] * 10)
+        wb.save(os.path.join(xl, f"C-{n:02d}.xlsx"))
+
+    # fotos por calicata
+    for n in range(1, p.calicatas + 1):
+        sub = os.path.join(fotos, f"Fotos C-{n:02d}")
+        os.makedirs(sub, exist_ok=True)
+        for f in range(p.fotos):
+            escribir_imagen(os.path.join(sub, f"foto_{f}.jpg"), p.ancho_foto, p.ancho_foto * 3 // 4, f"{p.semilla}-{n}-{f}")
+
+    # mapeos: alternar valor simple y promedio de rango
+    mappings = []
+    for k, enc in enumerate(encabezados):
+        col = chr(ord("B") + k % 24)
+        if k % 2:
+            mappings.append({"encabezado": enc, "hoja": "Datos", "celda": f"{col}2:{col}{p.filas_excel}", "tipo": "promedio"})
+        else:
+            mappings.append({"encabezado": enc, "hoja": "Datos", "celda": f"{col}{k + 2}", "tipo": "valor"})
+    return {
+        "docx_path": plantilla,
+        "excel_folder_1": xl,
+        "output_folder": salida,
+        "imagenes_folder": fotos,
+        "fixed_image_height": 4.0,
+        "mappings": mappings,
+        "text_replacements": [(f"MARCA_{k}", f"Proyecto {k}") for k in range(p.reemplazos)]
+                             + [(f"ZONA_{k}", f"Zona {k}") for k in range(p.reemplazos)],
+        "imagen_config": {
+            "usar_mapeo_automatico": p.imagenes > 0,
+            "imagen_mapeos": [{"posicion": i + 1, "imagen_subcarpeta": i % max(p.fotos, 1) + 1} for i in range(p.imagenes)],
+        },
+    }
+
+
+# ---------------------------
+# Mediciones
+# ---------------------------
+
+def resumir(tiempos):
+    return {"repeticiones": len(tiempos), "mediana": statistics.median(tiempos), "min": min(tiempos), "max": max(tiempos)}
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - t0)
+    return resumir(tiempos)
+
+
+def bench_flujos(gi, config_base, p):
+    resultados = {}
+    for tipo in ("individual", "consolidado"):
+        tiempos = []
+        etapas = None
+        for rep in range(p.repeticiones):
+            config = gi.config_por_defecto()
+            config.update(json.loads(json.dumps(config_base)))
+            config["informe_config"]["tipo_informe"] = tipo
+            config["procesamiento_config"].update(procesos=p.procesos, pipeline=p.pipeline, medir_etapas=True)
+            config["log_config"]["nivel"] = "avisos"
+            # sin caché de valores y con una caché de imágenes vacía por repetición: cada
+            # repetición vuelve a medir la lectura de los Excel y la reducción de las fotos
+            config["excel_config"]["cache_valores"] = False
+            config["imagen_config"]["carpeta_cache"] = os.path.join(
+                os.path.dirname(config["output_folder"]), f"cache_imagenes_{tipo}_{rep}")
+            avisos = []
+            procesador = gi.ProcesadorInformes(config, log=avisos.append)
+            t0 = time.perf_counter()
+            res = procesador.ejecutar(tipo, 1, p.calicatas)
+            tiempos.append(time.perf_counter() - t0)
+            if res["errores"]:
+                raise RuntimeError(f"El flujo {tipo} terminó con errores: {avisos[-5:]}")
+            if rep == p.repeticiones - 1:
+                etapas = leer_ultimas_etapas(config["output_folder"])
+        resultados[tipo] = resumir(tiempos)
+        resultados[tipo]["por_calicata"] = resultados[tipo]["mediana"] / p.calicatas
+        if etapas:
+            resultados[tipo]["etapas"] = etapas
+    return resultados
+
+
+def leer_ultimas_etapas(carpeta):
+    """Resumen por etapa del último rendimiento_*.json exportado por el generador."""
+    archivos = sorted(f for f in os.listdir(carpeta) if f.startswith("rendimiento_") and f.endswith(".json"))
+    if not archivos:
+        return None
+    with open(os.path.join(carpeta, archivos[-1]), "r", encoding="utf-8") as f:
+        return json.load(f)["resumen"]
+
+
+def bench_funciones(gi, config, p):
+    """Funciones sueltas sobre las mismas entradas (sin la caché de la ejecución)."""
+    excel = os.path.join(config["excel_folder_1"], "C-01.xlsx")
+    decimales = {"usar_decimales_fijos": True, "cantidad_decimales": 2}
+    mapeo = next((m for m in config["mappings"] if m["tipo"] == "promedio"), config["mappings"][0])
+    plantilla = gi.PlantillaWord(config["docx_path"])
+    pares = [("C-01", "C-07")] + list(config["text_replacements"])
+
+    def reemplazos():
+        doc = plantilla.nuevo_documento()
+        for viejo, nuevo in pares:
+            gi.reemplazar_texto_global(doc, viejo, nuevo)
+
+    doc_imagenes = plantilla.nuevo_documento()
+    return {
+        "extraer_dato_excel_mejorado": medir(lambda: gi.extraer_dato_excel_mejorado(
+            excel, mapeo["hoja"], mapeo["celda"], mapeo["tipo"], decimales), p.repeticiones),
+        "reemplazar_texto_global": medir(reemplazos, p.repeticiones),
+        "listar_imagenes_doc": medir(lambda: gi.listar_imagenes_doc(doc_imagenes), p.repeticiones * 10),
+    }
+
+
+def comparar(actual, base, tolerancia):
+    """Lista de regresiones: medianas que empeoran más que 'tolerancia' (fracción)."""
+    regresiones = []
+
+    def recorrer(a, b, ruta):
+        for clave, valor in a.items():
+            if clave not in b or not isinstance(valor, dict):
+                continue
+            if "mediana" in valor and "mediana" in b[clave] and b[clave]["mediana"] > 0:
+                cambio = valor["mediana"] / b[clave]["mediana"] - 1
+                if cambio > tolerancia:
+                    regresiones.append(f"{ruta}{clave}: {b[clave]['mediana']:.4f} s -> {valor['mediana']:.4f} s (+{cambio * 100:.0f}%)")
+            elif clave != "etapas":
+                recorrer(valor, b[clave], f"{ruta}{clave}.")
+
+    recorrer(actual, base, "")
+    return regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks del Generador de Informes con entradas sintéticas.")
+    parser.add_argument("--calicatas", type=int, default=20)
+    parser.add_argument("--tablas", type=int, default=4, help="Tablas de datos en la plantilla.")
+    parser.add_argument("--filas", type=int, default=8, help="Filas de datos por tabla.")
+    parser.add_argument("--mapeos", type=int, default=8, help="Mapeos Excel -> Word (encabezados).")
+    parser.add_argument("--reemplazos", type=int, default=10, help="Pares de marcadores de texto.")
+    parser.add_argument("--imagenes", type=int, default=2, help="Imágenes de la plantilla a reemplazar.")
+    parser.add_argument("--fotos", type=int, default=3, help="Fotos por subcarpeta de calicata.")
+    parser.add_argument("--ancho-foto", type=int, default=2000, help="Ancho en píxeles de las fotos sintéticas.")
+    parser.add_argument("--filas-excel", type=int, default=500, help="Filas de la hoja de datos de cada libro.")
+    parser.add_argument("--procesos", type=int, default=1)
+    parser.add_argument("--pipeline", action="store_true", help="Flujo individual en modo pipeline (lectura/escritura en segundo plano).")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla de los libros y colores de las fotos sintéticas.")
+    parser.add_argument("--salida", default="bench_informes.json", help="JSON de resultados.")
+    parser.add_argument("--comparar", default=None, help="JSON de una ejecución anterior para detectar regresiones.")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento admitido al comparar (0.2 = 20%%).")
+    parser.add_argument("--conservar", action="store_true", help="No borrar la carpeta temporal con las entradas.")
+    p = parser.parse_args(argv)
+
+    gi = cargar_generador()
+    carpeta = tempfile.mkdtemp(prefix="bench_informes_")
+    try:
+        t0 = time.perf_counter()
+        config = generar_entradas(carpeta, p)
+        print(f"Entradas sintéticas en {carpeta} ({time.perf_counter() - t0:.1f} s)")
+        resultados = bench_flujos(gi, config, p)
+        resultados["funciones"] = bench_funciones(gi, config, p)
+    finally:
+        if not p.conservar:
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+    parametros = {k: v for k, v in vars(p).items() if k not in ("salida", "comparar", "tolerancia", "conservar")}
+    datos = {"fecha": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+             "plataforma": platform.platform(), "parametros": parametros, "resultados": resultados}
+    with open(p.salida, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=1)
+
+    for tipo in ("individual", "consolidado"):
+        r = resultados[tipo]
+        print(f"{tipo}: mediana {r['mediana']:.2f} s ({r['por_calicata'] * 1000:.0f} ms/calicata)")
+    for nombre, r in resultados["funciones"].items():
+        print(f"{nombre}: mediana {r['mediana'] * 1000:.2f} ms")
+    print(f"Resultados en {p.salida}")
+
+    if p.comparar:
+        with open(p.comparar, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("parametros") != parametros:
+            print("Aviso: la referencia se midió con otros parámetros.")
+        regresiones = comparar(resultados, base.get("resultados", {}), p.tolerancia)
+        for r in regresiones:
+            print(f"REGRESIÓN {r}")
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())